@@ -30,17 +30,30 @@ it's easy to write your own fields.
 Got all that? Read on.
 """
 from __future__ import unicode_literals
-from six import with_metaclass, string_types, text_type, iteritems
-from functools import total_ordering
+from six import with_metaclass, string_types, text_type, integer_types, iteritems, reraise
+from six.moves import queue
+from functools import total_ordering, partial
 import warnings
 import collections
+import copy
 import datetime
+import decimal
+import bisect
+import threading
 import time
 import json
-
-import boto
-from boto.dynamodb.item import Item as _Item
-from boto.dynamodb.exceptions import DynamoDBKeyNotFoundError
+import hashlib
+import heapq
+import hmac
+import itertools
+import base64
+import random
+import zlib
+import os
+import sys
+
+# boto is imported when first needed, by `Layer2Backend`, which keeps
+# `import duo` quick for short-lived processes that never touch it.
 
 # First off, since we have integers as one of our two native data
 # types, we're going to do enumerated types, which are great. You're
@@ -176,393 +189,3018 @@ class EnumMeta(type):
             return super(EnumMeta, cls).__unicode__()
 
 
-# Now we're getting to the meat of the DynamoDB interactions. First
-# off, we need a way to manage an AWS connection to DynamoDB, and
-# associate a custom table type with that connection.
-
+class EnumSet(object):
+    """An immutable set of members of an enumerated type, packed into a bitmask.
 
-class DynamoDB(object):
-    """Manages a connection to DynamoDB and looks up custom Table handlers.
+    Each member occupies the bit given by its `index`, so membership
+    tests and set operations are plain integer arithmetic. Members may
+    be given as the members themselves, their names, or their indexes.
 
     Example::
 
-        DYNAMODB = duo.DynamoDB(
-            key = getattr(os.environ.get('DYNAMODB_ACCESS_KEY_ID'), ''),
-            secret = getattr(os.environ.get('DYNAMODB_SECRET_ACCESS_KEY'), ''),
-            cache = cache  # pymemcached-compatible cache object.
-            )
-
-         # Assuming you've already declared a table named `my_table_name`:
-         my_table = DYNAMODB['my_table_name']
+        perms = duo.EnumSet(Access, [FULL_ACCESS, 'TRIAL_ACCESS'])
+        FULL_ACCESS in perms  # True
+        int(perms) == 0b110
+        perms - [TRIAL_ACCESS] == duo.EnumSet(Access, [FULL_ACCESS])
     """
-    def __init__(self, key, secret, cache=None):
-        self.key = key
-        self.secret = secret
-        self._tables = {}
-        self.cache = cache
+    __slots__ = ('enum_type', 'mask')
+
+    def __init__(self, enum_type, members=0):
+        self.enum_type = enum_type
+        self.mask = self._to_mask(members)
+
+    def _to_mask(self, members):
+        if isinstance(members, EnumSet):
+            return members.mask
+        elif isinstance(members, bool):
+            raise TypeError('EnumSet requires members or an integer bitmask, not %r.' % members)
+        elif isinstance(members, integer_types):
+            if members < 0 or members >> len(self.enum_type):
+                raise ValueError('%r is not a valid %s bitmask.' % (members, self.enum_type.__name__))
+            return members
+        elif isinstance(members, (EnumMeta, string_types)):
+            # Enum members iterate over their siblings, and strings
+            # iterate over characters, so neither counts as a collection.
+            members = [members]
+
+        mask = 0
+        for member in members:
+            mask |= 1 << int(self.enum_type[member])
+        return mask
+
+    def __contains__(self, member):
+        try:
+            return bool(self.mask & (1 << int(self.enum_type[member])))
+        except (KeyError, IndexError, TypeError):
+            return False
 
-    @property
-    def connection(self):
-        """Lazy-load a boto DynamoDB connection.
-        """
-        if not hasattr(self, '_connection'):
-            self._connection = boto.connect_dynamodb(
-                aws_access_key_id=self.key,
-                aws_secret_access_key=self.secret
-            )
-        return self._connection
+    def __iter__(self):
+        mask = self.mask
+        for member in self.enum_type:
+            if mask & (1 << member.index):
+                yield member
 
-    def reset(self):
-        """Reset the DynamoDB connection and clear any cached tables.
-        """
-        if hasattr(self, '_connection'):
-            del self._connection
-        self._tables.clear()
+    def __len__(self):
+        return bin(self.mask).count('1')
 
-    def __getitem__(self, table_name):
-        """Retrieve a registered custom table by name.
-        """
-        if hasattr(table_name, 'table_name'):
-            table_name = table_name.table_name
+    def __int__(self):
+        return self.mask
 
-        if table_name not in self._tables:
-            self._tables[table_name] = self.connection.get_table(table_name)
+    __index__ = __int__
 
-        table = Table._table_types[table_name](self, self._tables[table_name], cache=self.cache)
-        table.table_name = table_name
-        return table
+    def __nonzero__(self):
+        return self.__bool__()
 
+    def __bool__(self):
+        return bool(self.mask)
 
-# Another metaclass. This one's similar to the EnumMeta, but much
-# simpler: it's just a place to record subclasses of our Table and
-# Item mount-points.
+    def __eq__(self, other):
+        try:
+            return self.mask == self._to_mask(other)
+        except (KeyError, IndexError, TypeError, ValueError):
+            return False
 
+    def __ne__(self, other):
+        return not self == other
 
-class _TableMeta(type):
-    """Metaclass plugin mount for plugins related to AWS DynamoDB tables.
+    def __hash__(self):
+        return hash(self.mask)
 
-    Don't worry about using this one yourself. This is the magic that
-    glues your custom tables and your custom items together.
-    """
-    def __init__(cls, name, bases, attrs):
-        # Marty Alchin's simple plugin framework, again:
-        # http://martyalchin.com/2008/jan/10/simple-plugin-framework/
-        if not hasattr(cls, '_table_types'):
-            # This branch only executes when processing the mount point itself.
-            # So, since this is a new plugin mount, not an implementation, this
-            # class shouldn't be registered as a plugin. Instead, it sets up a
-            # registry where custom plugins can be registered later.
-            cls._table_types = collections.defaultdict(lambda: cls)
-        else:
-            # This must be a plugin implementation, which should be registered.
-            cls._table_types[cls.table_name] = cls
+    def __or__(self, other):
+        return EnumSet(self.enum_type, self.mask | self._to_mask(other))
 
-            # Special handling for class member fields, if there are
-            # any. A field needs to know what its name is.
-            for name, value in iteritems(attrs.copy()):
-                if isinstance(value, Field):
-                    value.name = name
+    def __and__(self, other):
+        return EnumSet(self.enum_type, self.mask & self._to_mask(other))
 
+    def __sub__(self, other):
+        return EnumSet(self.enum_type, self.mask & ~self._to_mask(other))
 
-class Item(with_metaclass(_TableMeta, _Item)):
-    """
-    A boto DynamoDB Item, with caching secret sauce.
+    def __xor__(self, other):
+        return EnumSet(self.enum_type, self.mask ^ self._to_mask(other))
 
-    Subclass to customize fields and caching behavior. Subclassing
-    auto-registers with the DB.
+    __ror__ = __or__
+    __rand__ = __and__
+    __rxor__ = __xor__
 
-    This is the mount-point for custom Items. Sub-classes will
-    register themselves with this mount-point.
-    """
+    def __rsub__(self, other):
+        return EnumSet(self.enum_type, self._to_mask(other) & ~self.mask)
 
-    duo_db = None
-    duo_table = None
+    def issubset(self, other):
+        return self.mask & ~self._to_mask(other) == 0
 
-    table_name = None
-    cache = None
-    cache_duration = None
-    is_new = False
+    def issuperset(self, other):
+        other = self._to_mask(other)
+        return self.mask & other == other
 
-    def __init__(self, *args, **kwargs):
-        super(Item, self).__init__(*args, **kwargs)
-        self._original = self.copy()
+    def isdisjoint(self, other):
+        return self.mask & self._to_mask(other) == 0
 
-    @property
-    def dynamo_key(self):
-        """Return the hash_key or (hash_key, range_key) key.
+    def __repr__(self):
+        return '%s(%s, [%s])' % (self.__class__.__name__, self.enum_type.__name__,
+                                 ', '.join(str(m) for m in self))
 
-        The returned value is suitable for looking up the item in the
-        table via __getitem__(key)
-        """
-        if self.range_key_name is None:
-            return self.hash_key
-        else:
-            return (self.hash_key, self.range_key)
 
-    @property
-    def _cache_key(self):
-        """Determine the key for accessing the item in the cache.
-        """
-        return self.duo_table._get_cache_key(self.hash_key, self.range_key)
+# Next, a little vocabulary for talking to DynamoDB about values it
+# has stored: binary values, and conditions, for range keys and scan
+# filters. The conditions mirror `boto.dynamodb.condition` name for
+# name, so you can use either; boto's are accepted anywhere duo's are.
 
-    def _set_cache(self):
-        """Store the item in the cache.
-        """
-        if self.cache is not None and self.cache_duration is not None:
-            table = self.duo_table
-            key = table._get_cache_key(self.hash_key, self.range_key)
-            duration = self.cache_duration if self.cache_duration is not None else table.cache_duration
-            self.cache.set(key, list(self.items()), duration)
 
-    def _delete_cache(self):
-        """Remove the item from the cache.
-        """
-        if self.cache is not None:
-            table = self.duo_table
-            key = table._get_cache_key(self.hash_key, self.range_key)
-            self.cache.delete(key)
+class Binary(object):
+    """Bytes to be stored as a DynamoDB binary attribute, rather than a string.
 
-    def get_expected(self):
-        """Get a dictionary of original values for the object, with new attributes filled in w/ False.
+    On Python 2, `bytes` and `str` are the same type, so every backend
+    needs binary values marked out explicitly.
+    """
+    def __init__(self, value):
+        self.value = getattr(value, 'value', value)
+        if not isinstance(self.value, bytes):
+            raise TypeError('Binary values must be bytes, not %r.' % type(self.value))
 
-        This is useful for the `expected_value` argument to put/save.
-        """
-        expected = {}
-        for key in self.items():
-            expected[key] = False
-        expected.update(self._original)
-        return expected
+    def __eq__(self, other):
+        return self.value == getattr(other, 'value', other)
 
-    def put(self, *args, **kwargs):
-        """Put the item in the database, and also in the cache.
-        """
-        result = super(Item, self).put(*args, **kwargs)
-        self.is_new = False
-        try:
-            self._set_cache()
-        except Exception as e:
-            warnings.warn('Cache write-through failed on put(). %s: %s' % (e.__class__.__name__, e.message))
-        return result
+    def __ne__(self, other):
+        return not self == other
 
-    def put_conditionally(self, *args, **kwargs):
-        """Put the item in the database, but only if the original values still hold.
-        """
-        kwargs['expected_value'] = self.get_expected()
-        return self.put(*args, **kwargs)
+    def __hash__(self):
+        return hash(self.value)
 
-    def save(self, *args, **kwargs):
-        """Save the item in the database, and also in the cache.
-        """
-        result = super(Item, self).save(*args, **kwargs)
-        self.is_new = False
-        try:
-            self._set_cache()
-        except Exception as e:
-            warnings.warn('Cache write-through failed on save(). %s: %s' % (e.__class__.__name__, e.message))
-        return result
+    def __lt__(self, other):
+        # DynamoDB orders binary keys byte by byte.
+        return self.value < getattr(other, 'value', other)
 
-    def save_conditionally(self, *args, **kwargs):
-        """Save the updated item in the database, but only if the original values still hold.
-        """
-        kwargs['expected_value'] = self.get_expected()
-        return self.save(*args, **kwargs)
+    def __len__(self):
+        return len(self.value)
 
-    def delete(self, *args, **kwargs):
-        """Delete the item from the database, and also from the cache.
-        """
-        result = super(Item, self).delete(*args, **kwargs)
-        self.is_new = True
-        try:
-            self._delete_cache()
-        except Exception as e:
-            warnings.warn('Cache write-through failed on delete(). %s: %s' % (e.__class__.__name__, e.message))
-        return result
+    def __repr__(self):
+        return 'Binary(%r)' % self.value
 
 
-class Table(with_metaclass(_TableMeta, object)):
+class Condition(object):
+    """Base class for comparisons against a stored attribute.
     """
-    A DynamoDB Table, with super dict-like powers.
+    @property
+    def operator(self):
+        return self.__class__.__name__
 
-    Subclass to customize behavior. Subclassing auto-registers with
-    the DB.
+    @property
+    def arguments(self):
+        return []
 
-    This is the mount-point for custom Tables. Sub-classes will
-    register themselves with this mount-point.
-    """
+    def __eq__(self, other):
+        return (self.operator, self.arguments) == _condition_args(other)
 
-    table_name = None
-    hash_key_name = None
-    range_key_name = None
+    def __ne__(self, other):
+        return not self == other
 
-    cache = None
-    cache_prefix = None
+    def __repr__(self):
+        return '%s(%s)' % (self.operator, ', '.join(repr(a) for a in self.arguments))
 
-    def __init__(self, db, table, cache=None):
-        self.duo_db = db
-        self.table = table
-        if self.cache is None:
-            self.cache = cache
-        super(Table, self).__init__()
 
-    def keys(self):
-        """Return an iterator of object keys, either by `hash_key` or `(hash_key, range_key)`.
+class _ConditionNoArgs(Condition):
+    pass
 
-        WARNING: This performs a table scan, which can be expensive on a large table.
-        """
-        if self.range_key_name is None:
-            return (i[self.hash_key_name] for i in self.scan(attributes_to_get=[self.hash_key_name]))
-        else:
-            return ((i[self.hash_key_name], i[self.range_key_name])
-                    for i in self.scan(attributes_to_get=[self.hash_key_name, self.range_key_name]))
 
-    def items(self):
-        """Return an iterator of object key/value pairs, either by `hash_key` or `(hash_key, range_key)`.
+class _ConditionOneArg(Condition):
+    def __init__(self, v1):
+        self.v1 = v1
 
-        WARNING: This performs a table scan, which can be expensive on a large table.
-        """
-        if self.range_key_name is None:
-            return ((i[self.hash_key_name], i) for i in self.scan())
-        else:
-            return (((i[self.hash_key_name], i[self.range_key_name]), i)
-                    for i in self.scan())
+    @property
+    def arguments(self):
+        return [self.v1]
 
-    def values(self):
-        """Return an iterator of objects in the table.
 
-        Equivalent of `.scan()` sans arguments.
+class _ConditionTwoArgs(Condition):
+    def __init__(self, v1, v2):
+        self.v1 = v1
+        self.v2 = v2
 
-        WARNING: This performs a table scan, which can be expensive on a large table.
-        """
-        return self.scan()
+    @property
+    def arguments(self):
+        return [self.v1, self.v2]
 
-    def create(self, hash_key, range_key=None, **kwargs):
-        """Create an item given the specified attributes.
-        """
-        item = self.table.new_item(
-            hash_key = hash_key,
-            range_key = range_key,
-            attrs = kwargs,
-            item_class = Item._table_types[self.table_name],
-        )
-        return self._extend(item, is_new=True)
 
-    def _extend(self, item, is_new=False):
-        """Extend the given Item with some necessary attributes.
-        """
-        item.is_new = is_new
-        item.cache = self.cache
-        item.duo_table = self
-        item.duo_db = self.duo_db
-        return item
+class _ConditionSeveralArgs(Condition):
+    def __init__(self, values):
+        self.values = values
 
-    def _extend_iter(self, items, is_new=False):
-        """Extend a collection of Items with some necessary attributes.
-        """
-        for item in items:
-            yield self._extend(item, is_new)
+    @property
+    def arguments(self):
+        return list(self.values)
 
-    @classmethod
-    def _get_cache_key(cls, hash_key, range_key):
-        """Determine the cache key for a given table key.
 
-        Specify `range_key=None` for a hash-only key.
-        """
-        if range_key is None:
-            key = '%s_%s' % (cls.cache_prefix or cls.table_name, hash_key)
-        else:
-            key = '%s_%s_%s' % (cls.cache_prefix or cls.table_name, hash_key, range_key)
-        return key
+class EQ(_ConditionOneArg): pass
 
-    def _get_cache(self, hash_key, range_key=None):
-        """Retrieve the specified item from the cache, if available.
-        """
-        if self.cache is None:
-            return None
-        else:
-            key = self._get_cache_key(hash_key, range_key)
-            cached = self.cache.get(key)
-            if cached is not None:
-                # Build an Item.
-                cached = self._extend(
-                    Item._table_types[self.table_name](
-                        self.table,
-                        hash_key = hash_key,
-                        range_key = range_key,
-                        attrs = dict(cached)
-                    ))
-            return cached
 
-    def get_item(self, hash_key, range_key=None, **params):
-        item = self._extend(
-            self.table.get_item(
-                hash_key = hash_key,
-                range_key = range_key,
-                item_class = Item._table_types[self.table_name],
-                **params
-            )
-        )
-        item._set_cache()
-        return item
+class NE(_ConditionOneArg): pass
 
-    def __getitem__(self, key):
-        if isinstance(key, tuple):
-            hash_key, range_key = key
-        else:
-            hash_key = key
-            range_key = None
 
-        # Check the cache first.
-        cached = self._get_cache(hash_key, range_key)
-        if cached is not None:
-            return cached
+class LE(_ConditionOneArg): pass
 
-        try:
-            if range_key is None:
-                if self.range_key_name is None:
-                    item = self.get_item(hash_key)
-                else:
-                    return self.query(hash_key)
-            else:
-                item = self.get_item(hash_key, range_key)
-        except DynamoDBKeyNotFoundError:
-            item = self.create(hash_key, range_key)
 
-        if hasattr(item, 'is_new') and not item.is_new:
-            item._set_cache()
+class LT(_ConditionOneArg): pass
 
-        return item
 
-    def query(self, hash_key, range_key_condition=None,
-              attributes_to_get=None, request_limit=None,
-              max_results=None, consistent_read=False,
-              scan_index_forward=True, exclusive_start_key=None):
-        """Perform a query on the table.
+class GE(_ConditionOneArg): pass
+
+
+class GT(_ConditionOneArg): pass
+
+
+class NULL(_ConditionNoArgs): pass
+
+
+class NOT_NULL(_ConditionNoArgs): pass
+
+
+class CONTAINS(_ConditionOneArg): pass
+
+
+class NOT_CONTAINS(_ConditionOneArg): pass
+
+
+class BEGINS_WITH(_ConditionOneArg): pass
+
+
+class IN(_ConditionSeveralArgs): pass
+
+
+class BETWEEN(_ConditionTwoArgs): pass
+
+
+def _condition_args(condition):
+    """Break a duo or boto condition down into `(operator, [arguments])`.
+    """
+    if isinstance(condition, Condition):
+        return condition.operator, condition.arguments
+    elif hasattr(condition, 'values'):
+        return condition.__class__.__name__, list(condition.values)
+    elif hasattr(condition, 'v2'):
+        return condition.__class__.__name__, [condition.v1, condition.v2]
+    elif hasattr(condition, 'v1'):
+        return condition.__class__.__name__, [condition.v1]
+    else:
+        return condition.__class__.__name__, []
+
+
+def _condition_matches(condition, attrs, name):
+    """Evaluate a condition against an item's attribute, the way DynamoDB would.
+    """
+    operator, arguments = _condition_args(condition)
+    if name not in attrs:
+        return operator in ('NULL', 'NE', 'NOT_CONTAINS')
+    value = attrs[name]
+    try:
+        if operator == 'EQ':
+            return value == arguments[0]
+        elif operator == 'NE':
+            return value != arguments[0]
+        elif operator == 'LE':
+            return _same_kind(value, arguments[0]) and value <= arguments[0]
+        elif operator == 'LT':
+            return _same_kind(value, arguments[0]) and value < arguments[0]
+        elif operator == 'GE':
+            return _same_kind(value, arguments[0]) and value >= arguments[0]
+        elif operator == 'GT':
+            return _same_kind(value, arguments[0]) and value > arguments[0]
+        elif operator == 'NULL':
+            return False
+        elif operator == 'NOT_NULL':
+            return True
+        elif operator == 'CONTAINS':
+            return arguments[0] in value
+        elif operator == 'NOT_CONTAINS':
+            return arguments[0] not in value
+        elif operator == 'BEGINS_WITH':
+            return isinstance(value, string_types) and value.startswith(arguments[0])
+        elif operator == 'IN':
+            return value in arguments
+        elif operator == 'BETWEEN':
+            return (_same_kind(value, arguments[0]) and _same_kind(value, arguments[1])
+                    and arguments[0] <= value <= arguments[1])
+    except TypeError:
+        return False
+    raise ValueError('Unknown comparison operator %r.' % operator)
+
+
+def _same_kind(a, b):
+    """Are these both strings, or both numbers, as far as DynamoDB is concerned?
+    """
+    if isinstance(a, string_types):
+        return isinstance(b, string_types)
+    return not isinstance(b, string_types)
+
+
+class ItemNotFound(KeyError):
+    """The requested item doesn't exist in the table.
+    """
+
+
+class ConditionalCheckFailed(Exception):
+    """An item didn't match the expected values of a conditional write.
+    """
+
+
+class VersionConflict(ConditionalCheckFailed):
+    """An item's VersionField moved on between reading the item and writing it.
+    """
+
+
+# Now we're getting to the meat of the DynamoDB interactions. Duo
+# doesn't talk to DynamoDB itself: a backend does that, turning plain
+# dicts of attributes into requests and responses back into plain
+# dicts. Duo builds Items out of those dicts.
+
+
+ResultPage = collections.namedtuple('ResultPage', ['items', 'last_evaluated_key'])
+ResultPage.__doc__ = """One response's worth of query or scan results.
+
+`items` is a list of attribute dicts. `last_evaluated_key` is `(hash_key,)`
+or `(hash_key, range_key)`, suitable for `exclusive_start_key`, or None
+on the last page.
+"""
+
+
+class Backend(object):
+    """The interface between duo and a DynamoDB client library.
+
+    Subclass to adapt a new client. Tables are identified by whatever
+    `get_table()` returns; keys by plain `hash_key` and `range_key`
+    values; items travel as plain dicts of attributes. Updates are
+    `{name: (action, value)}`, where action is 'PUT', 'ADD' or
+    'DELETE', and expected values are `{name: value}`, with `False`
+    meaning "must not exist" and `True` meaning "must exist". Writes
+    whose expected values don't hold raise ConditionalCheckFailed.
+
+    Set `thread_safe` if several threads can share one connection;
+    otherwise, threads that need one get a copy of the backend.
+    """
+    parallel_scan = False
+    thread_safe = False
+
+    def __init__(self, key=None, secret=None, **params):
+        self.key = key
+        self.secret = secret
+        self.params = params
+
+    @property
+    def connection(self):
+        """Lazy-load the underlying client connection.
+        """
+        if not hasattr(self, '_connection'):
+            self._connection = self.connect()
+        return self._connection
+
+    def connect(self):
+        raise NotImplementedError()
+
+    def __getstate__(self):
+        # Connections don't pickle; a copy (say, in a worker process)
+        # connects afresh.
+        state = self.__dict__.copy()
+        state.pop('_connection', None)
+        return state
+
+    def reset(self):
+        """Drop the underlying client connection.
+        """
+        if hasattr(self, '_connection'):
+            del self._connection
+
+    def get_table(self, table_name):
+        """Look up a table, returning a handle for the other methods.
+        """
+        raise NotImplementedError()
+
+    def get_key_names(self, table):
+        """Return `(hash_key_name, range_key_name)` for a table.
+        """
+        raise NotImplementedError()
+
+    def get_item(self, table, hash_key, range_key=None, attributes_to_get=None, consistent_read=False):
+        """Return an item's attributes, or raise ItemNotFound.
+        """
+        raise NotImplementedError()
+
+    def batch_get(self, table, keys, attributes_to_get=None, consistent_read=False):
+        """Return the attributes of every item found among `keys`, in no particular order.
+
+        `keys` are `(hash_key, range_key)` pairs, with None for hash-only tables.
+        """
+        raise NotImplementedError()
+
+    def put_item(self, table, attrs, expected_value=None, return_values=None):
+        """Put an item, returning a dict with any `return_values` as its `Attributes`.
+        """
+        raise NotImplementedError()
+
+    def update_item(self, table, hash_key, range_key, updates, expected_value=None, return_values=None):
+        """Update an item's attributes, returning a dict like `put_item()`'s.
+
+        An item that doesn't exist yet is created.
+        """
+        raise NotImplementedError()
+
+    def delete_item(self, table, hash_key, range_key=None, expected_value=None, return_values=None):
+        raise NotImplementedError()
+
+    def batch_write(self, table, puts=(), deletes=()):
+        """Put and delete items in bulk.
+
+        `puts` are attribute dicts; `deletes` are `(hash_key, range_key)`
+        pairs. Returns `(puts, deletes)` of whatever DynamoDB didn't
+        get around to processing, for the caller to retry.
+        """
+        raise NotImplementedError()
+
+    def query(self, table, hash_key, range_key_condition=None, attributes_to_get=None, request_limit=None,
+              max_results=None, consistent_read=False, scan_index_forward=True, exclusive_start_key=None,
+              query_filter=None):
+        """Generate a ResultPage per query request.
+
+        `query_filter` is like a scan filter, for non-key attributes.
+        """
+        raise NotImplementedError()
+
+    def scan(self, table, scan_filter=None, attributes_to_get=None, request_limit=None, max_results=None,
+             count=False, exclusive_start_key=None, segment=None, total_segments=None):
+        """Generate a ResultPage per scan request.
+
+        With `total_segments`, scan only the given `segment` of the
+        table, for parallel scans. Backends that can't say so with
+        `parallel_scan = False`.
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    def _limit(request_limit, remaining):
+        """Work out the request limit, given how many results are still wanted.
+        """
+        if remaining is None:
+            return request_limit
+        elif request_limit is None:
+            return remaining
+        else:
+            return min(request_limit, remaining)
+
+    def _truncate(self, table, items, last_evaluated_key, remaining):
+        """Trim a page to the results still wanted, fixing up the key to continue from.
+        """
+        if remaining is not None and len(items) > remaining:
+            items = items[:remaining]
+            hash_key_name, range_key_name = self.get_key_names(table)
+            last = items[-1] if items else {}
+            last_evaluated_key = (last.get(hash_key_name),)
+            if range_key_name is not None:
+                last_evaluated_key += (last.get(range_key_name),)
+        return ResultPage(items, last_evaluated_key)
+
+    @staticmethod
+    def _chunks(values, size):
+        values = list(values)
+        for start in range(0, len(values), size):
+            yield values[start:start + size]
+
+
+class Layer2Backend(Backend):
+    """A backend built on `boto.dynamodb.layer2`, as duo always has been.
+
+    Table handles are `boto.dynamodb.table.Table` objects, and the
+    connection is a `boto.dynamodb.layer2.Layer2`.
+    """
+    def connect(self):
+        import boto
+        layer2 = boto.connect_dynamodb(
+            aws_access_key_id=self.key,
+            aws_secret_access_key=self.secret,
+            **self.params
+        )
+        layer2.dynamizer = _BinaryDynamizer(layer2.dynamizer)
+        return layer2
+
+    def get_table(self, table_name):
+        return self.connection.get_table(table_name)
+
+    def get_key_names(self, table):
+        return table.schema.hash_key_name, table.schema.range_key_name
+
+    def _key(self, table, hash_key, range_key=None):
+        return self.connection.build_key_from_values(table.schema, hash_key, range_key)
+
+    def _condition(self, condition):
+        operator, arguments = _condition_args(condition)
+        encode = self.connection.dynamizer.encode
+        result = {'ComparisonOperator': operator}
+        if arguments:
+            result['AttributeValueList'] = [encode(a) for a in arguments]
+        return result
+
+    def _updates(self, updates):
+        return self.connection.dynamize_attribute_updates(updates)
+
+    @property
+    def _key_not_found(self):
+        from boto.dynamodb.exceptions import DynamoDBKeyNotFoundError
+        return DynamoDBKeyNotFoundError
+
+    @property
+    def _check_failed(self):
+        from boto.dynamodb.exceptions import DynamoDBConditionalCheckFailedError
+        return DynamoDBConditionalCheckFailedError
+
+    def get_item(self, table, hash_key, range_key=None, attributes_to_get=None, consistent_read=False):
+        layer2 = self.connection
+        try:
+            response = layer2.layer1.get_item(table.name, self._key(table, hash_key, range_key),
+                                              attributes_to_get, consistent_read,
+                                              object_hook=layer2.dynamizer.decode)
+        except self._key_not_found:
+            raise ItemNotFound((hash_key, range_key))
+        return response['Item']
+
+    def batch_get(self, table, keys, attributes_to_get=None, consistent_read=False):
+        layer2 = self.connection
+        results = []
+        for chunk in self._chunks(keys, 100):
+            request = {'Keys': [self._key(table, h, r) for h, r in chunk]}
+            if attributes_to_get:
+                request['AttributesToGet'] = attributes_to_get
+            request_items = {table.name: request}
+            while request_items:
+                response = layer2.layer1.batch_get_item(request_items, object_hook=layer2.dynamizer.decode)
+                results.extend(response.get('Responses', {}).get(table.name, {}).get('Items', []))
+                request_items = response.get('UnprocessedKeys')
+                if request_items:
+                    # Unprocessed keys come back decoded; encode them again.
+                    request = request_items[table.name]
+                    request['Keys'] = [self._key(table, k['HashKeyElement'], k.get('RangeKeyElement'))
+                                       for k in request['Keys']]
+        return results
+
+    def put_item(self, table, attrs, expected_value=None, return_values=None):
+        layer2 = self.connection
+        try:
+            return layer2.layer1.put_item(table.name, layer2.dynamize_item(attrs),
+                                          layer2.dynamize_expected_value(expected_value), return_values,
+                                          object_hook=layer2.dynamizer.decode)
+        except self._check_failed as e:
+            raise ConditionalCheckFailed(str(e))
+
+    def update_item(self, table, hash_key, range_key, updates, expected_value=None, return_values=None):
+        layer2 = self.connection
+        try:
+            return layer2.layer1.update_item(table.name, self._key(table, hash_key, range_key),
+                                             self._updates(updates),
+                                             layer2.dynamize_expected_value(expected_value), return_values,
+                                             object_hook=layer2.dynamizer.decode)
+        except self._check_failed as e:
+            raise ConditionalCheckFailed(str(e))
+
+    def delete_item(self, table, hash_key, range_key=None, expected_value=None, return_values=None):
+        layer2 = self.connection
+        try:
+            return layer2.layer1.delete_item(table.name, self._key(table, hash_key, range_key),
+                                             expected=layer2.dynamize_expected_value(expected_value),
+                                             return_values=return_values,
+                                             object_hook=layer2.dynamizer.decode)
+        except self._check_failed as e:
+            raise ConditionalCheckFailed(str(e))
+
+    def batch_write(self, table, puts=(), deletes=()):
+        layer2 = self.connection
+        requests = [{'PutRequest': {'Item': layer2.dynamize_item(attrs)}} for attrs in puts]
+        requests.extend({'DeleteRequest': {'Key': self._key(table, h, r)}} for h, r in deletes)
+        unprocessed_puts, unprocessed_deletes = [], []
+        for chunk in self._chunks(requests, 25):
+            response = layer2.layer1.batch_write_item({table.name: chunk}, object_hook=layer2.dynamizer.decode)
+            for request in response.get('UnprocessedItems', {}).get(table.name, []):
+                if 'PutRequest' in request:
+                    unprocessed_puts.append(request['PutRequest']['Item'])
+                else:
+                    key = request['DeleteRequest']['Key']
+                    unprocessed_deletes.append((key['HashKeyElement'], key.get('RangeKeyElement')))
+        return unprocessed_puts, unprocessed_deletes
+
+    def _pages(self, table, method, kwargs, max_results, request_limit, query_filter=None, trim=()):
+        layer2 = self.connection
+        remaining = max_results
+        while remaining is None or remaining > 0:
+            kwargs['limit'] = self._limit(request_limit, remaining)
+            response = method(object_hook=layer2.dynamizer.decode, **kwargs)
+            lek = response.get('LastEvaluatedKey')
+            last_evaluated_key = None
+            if lek is not None:
+                last_evaluated_key = (lek['HashKeyElement'],)
+                if 'RangeKeyElement' in lek:
+                    last_evaluated_key += (lek['RangeKeyElement'],)
+
+            items = response.get('Items', [])
+            if query_filter:
+                items = [i for i in items
+                         if all(_condition_matches(c, i, name) for name, c in iteritems(query_filter))]
+            for item in items:
+                for name in trim:
+                    item.pop(name, None)
+            page = self._truncate(table, items, last_evaluated_key, remaining)
+            yield page
+            if page.last_evaluated_key is None:
+                break
+            if remaining is not None:
+                remaining -= len(page.items)
+            kwargs['exclusive_start_key'] = self._key(table, *page.last_evaluated_key)
+
+    def query(self, table, hash_key, range_key_condition=None, attributes_to_get=None, request_limit=None,
+              max_results=None, consistent_read=False, scan_index_forward=True, exclusive_start_key=None,
+              query_filter=None):
+        """Query the table.
+
+        The layer2 API predates query filters, so `query_filter` is
+        applied here, to each page of results. Filtered attributes are
+        fetched along with `attributes_to_get` for the purpose, and
+        dropped again afterwards.
+        """
+        layer2 = self.connection
+        trim = []
+        if query_filter and attributes_to_get is not None:
+            trim = [name for name in query_filter if name not in attributes_to_get]
+            attributes_to_get = list(attributes_to_get) + trim
+        kwargs = dict(
+            table_name = table.name,
+            hash_key_value = layer2.dynamizer.encode(hash_key),
+            range_key_conditions = self._condition(range_key_condition) if range_key_condition else None,
+            attributes_to_get = attributes_to_get,
+            consistent_read = consistent_read,
+            scan_index_forward = scan_index_forward,
+            exclusive_start_key = self._key(table, *exclusive_start_key) if exclusive_start_key else None,
+        )
+        return self._pages(table, layer2.layer1.query, kwargs, max_results, request_limit, query_filter, trim)
+
+    def scan(self, table, scan_filter=None, attributes_to_get=None, request_limit=None, max_results=None,
+             count=False, exclusive_start_key=None, segment=None, total_segments=None):
+        if total_segments is not None and total_segments > 1:
+            raise ValueError('Layer2Backend cannot scan in segments, since the layer2 API predates parallel '
+                             'scans; use Boto3Backend or MemoryBackend.')
+        layer2 = self.connection
+        kwargs = dict(
+            table_name = table.name,
+            scan_filter = dict((name, self._condition(c)) for name, c in iteritems(scan_filter))
+                          if scan_filter else None,
+            attributes_to_get = attributes_to_get,
+            count = count,
+            exclusive_start_key = self._key(table, *exclusive_start_key) if exclusive_start_key else None,
+        )
+        return self._pages(table, layer2.layer1.scan, kwargs, max_results, request_limit)
+
+
+class _BinaryDynamizer(object):
+    """Wrap a boto dynamizer, translating between duo's and boto's `Binary`.
+    """
+    def __init__(self, dynamizer):
+        from boto.dynamodb.types import Binary as BotoBinary
+        self.dynamizer = dynamizer
+        self.binary_type = BotoBinary
+
+    def encode(self, attr):
+        if isinstance(attr, Binary):
+            attr = self.binary_type(attr.value)
+        elif isinstance(attr, (set, frozenset)) and attr and all(isinstance(v, Binary) for v in attr):
+            attr = set(self.binary_type(v.value) for v in attr)
+        return self.dynamizer.encode(attr)
+
+    def decode(self, attr):
+        value = self.dynamizer.decode(attr)
+        if isinstance(value, self.binary_type):
+            return Binary(value.value)
+        elif isinstance(value, set) and 'BS' in attr:
+            return set(Binary(v.value) for v in value)
+        return value
+
+
+class TableSchema(object):
+    """A table's name and key schema, for backends without a table object of their own.
+    """
+    def __init__(self, name, hash_key_name, range_key_name=None):
+        self.name = name
+        self.hash_key_name = hash_key_name
+        self.range_key_name = range_key_name
+
+    def key(self, hash_key, range_key=None):
+        """Build the key attributes for an item.
+        """
+        key = {self.hash_key_name: hash_key}
+        if self.range_key_name is not None:
+            key[self.range_key_name] = range_key
+        return key
+
+    def key_tuple(self, attrs):
+        """Pull the `(hash_key, range_key)` pair out of an item's attributes.
+        """
+        if self.range_key_name is None:
+            return attrs[self.hash_key_name], None
+        return attrs[self.hash_key_name], attrs[self.range_key_name]
+
+    def __repr__(self):
+        return '%s(%r, %r, %r)' % (self.__class__.__name__, self.name, self.hash_key_name, self.range_key_name)
+
+
+def _decode_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+class Boto3Backend(Backend):
+    """A backend built on the low-level boto3 (botocore) DynamoDB client.
+
+    Responses are decoded straight into attribute dicts, skipping
+    boto's item and generator objects. Extra keyword arguments go to
+    `boto3.client()`, e.g. `region_name` or `endpoint_url`; or pass a
+    ready-made `client`.
+
+    Table handles are `TableSchema` objects.
+    """
+    parallel_scan = True
+    # botocore clients are safe to share between threads.
+    thread_safe = True
+
+    _decoders = {
+        'S': lambda v: v,
+        'N': _decode_number,
+        'B': Binary,
+        'SS': set,
+        'NS': lambda v: set(_decode_number(n) for n in v),
+        'BS': lambda v: set(Binary(b) for b in v),
+        'BOOL': lambda v: v,
+        'NULL': lambda v: None,
+        'L': lambda v: [Boto3Backend._decode(i) for i in v],
+        'M': lambda v: dict((k, Boto3Backend._decode(i)) for k, i in iteritems(v)),
+    }
+
+    # How to build a client like the one given to the constructor,
+    # once this backend has been pickled without it.
+    _client_params = None
+
+    def __init__(self, key=None, secret=None, client=None, **params):
+        super(Boto3Backend, self).__init__(key, secret, **params)
+        if client is not None:
+            self._connection = self._client = client
+
+    def connect(self):
+        import boto3
+        client = self.__dict__.get('_client')
+        params = self._describe_client(client) if client is not None else self._client_params
+        if params is not None:
+            return boto3.client('dynamodb', **params)
+        return boto3.client(
+            'dynamodb',
+            aws_access_key_id=self.key,
+            aws_secret_access_key=self.secret,
+            **self.params
+        )
+
+    @staticmethod
+    def _describe_client(client):
+        """Find the parameters to build another client like `client`.
+        """
+        params = dict(region_name=client.meta.region_name, endpoint_url=client.meta.endpoint_url,
+                      config=client.meta.config)
+        credentials = client._request_signer._credentials
+        if credentials is not None:
+            credentials = credentials.get_frozen_credentials()
+            params.update(aws_access_key_id=credentials.access_key, aws_secret_access_key=credentials.secret_key,
+                          aws_session_token=credentials.token)
+        return params
+
+    def __getstate__(self):
+        # A client given to the constructor doesn't pickle either, but a
+        # copy (say, in a worker process) should still use its endpoint,
+        # region, config and credentials.
+        state = super(Boto3Backend, self).__getstate__()
+        client = state.pop('_client', None)
+        if client is not None:
+            state['_client_params'] = self._describe_client(client)
+        return state
+
+    def reset(self):
+        super(Boto3Backend, self).reset()
+        self.__dict__.pop('_schemas', None)
+
+    @classmethod
+    def _decode(cls, value):
+        (kind, value), = iteritems(value)
+        return cls._decoders[kind](value)
+
+    @classmethod
+    def _decode_item(cls, item):
+        decode = cls._decode
+        return dict((name, decode(value)) for name, value in iteritems(item))
+
+    @staticmethod
+    def _encode(value):
+        # The inverse of `_decode`, so that anything read can be written back.
+        if value is None:
+            return {'NULL': True}
+        elif isinstance(value, Binary):
+            return {'B': value.value}
+        elif isinstance(value, string_types):
+            return {'S': value}
+        elif isinstance(value, bytes):
+            return {'B': value}
+        elif isinstance(value, bool):
+            return {'BOOL': value}
+        elif isinstance(value, integer_types):
+            return {'N': str(value)}
+        elif isinstance(value, (float, decimal.Decimal)):
+            return {'N': repr(value) if isinstance(value, float) else str(value)}
+        elif isinstance(value, (set, frozenset)):
+            if all(isinstance(v, string_types) for v in value):
+                return {'SS': list(value)}
+            elif all(isinstance(v, (Binary, bytes)) for v in value):
+                return {'BS': [getattr(v, 'value', v) for v in value]}
+            else:
+                return {'NS': [Boto3Backend._encode(v)['N'] for v in value]}
+        elif isinstance(value, (list, tuple)):
+            return {'L': [Boto3Backend._encode(v) for v in value]}
+        elif isinstance(value, dict):
+            return {'M': dict((k, Boto3Backend._encode(v)) for k, v in iteritems(value))}
+        raise TypeError('Unsupported type "%s" for value "%s"' % (type(value), value))
+
+    def _encode_item(self, attrs):
+        encode = self._encode
+        return dict((name, encode(value)) for name, value in iteritems(attrs))
+
+    def _key(self, table, hash_key, range_key=None):
+        return self._encode_item(table.key(hash_key, range_key))
+
+    def _condition(self, condition):
+        operator, arguments = _condition_args(condition)
+        result = {'ComparisonOperator': operator}
+        if arguments:
+            result['AttributeValueList'] = [self._encode(a) for a in arguments]
+        return result
+
+    def _expected(self, expected_value):
+        expected = {}
+        for name, value in iteritems(expected_value or {}):
+            if value is True or value is False:
+                expected[name] = {'Exists': value}
+            else:
+                expected[name] = {'Value': self._encode(value)}
+        return expected
+
+    def _options(self, expected_value=None, return_values=None):
+        options = {}
+        if expected_value:
+            options['Expected'] = self._expected(expected_value)
+        if return_values:
+            options['ReturnValues'] = return_values
+        return options
+
+    def _last_evaluated_key(self, table, response):
+        lek = response.get('LastEvaluatedKey')
+        if lek is None:
+            return None
+        lek = self._decode_item(lek)
+        if table.range_key_name is None:
+            return (lek[table.hash_key_name],)
+        return (lek[table.hash_key_name], lek[table.range_key_name])
+
+    def get_table(self, table_name):
+        schemas = self.__dict__.setdefault('_schemas', {})
+        if table_name not in schemas:
+            description = self.connection.describe_table(TableName=table_name)['Table']
+            names = dict((k['KeyType'], k['AttributeName']) for k in description['KeySchema'])
+            schemas[table_name] = TableSchema(table_name, names['HASH'], names.get('RANGE'))
+        return schemas[table_name]
+
+    def get_key_names(self, table):
+        return table.hash_key_name, table.range_key_name
+
+    def get_item(self, table, hash_key, range_key=None, attributes_to_get=None, consistent_read=False):
+        params = dict(TableName=table.name, Key=self._key(table, hash_key, range_key),
+                      ConsistentRead=consistent_read)
+        if attributes_to_get:
+            params['AttributesToGet'] = attributes_to_get
+        response = self.connection.get_item(**params)
+        if 'Item' not in response:
+            raise ItemNotFound((hash_key, range_key))
+        return self._decode_item(response['Item'])
+
+    def batch_get(self, table, keys, attributes_to_get=None, consistent_read=False):
+        results = []
+        for chunk in self._chunks(keys, 100):
+            request = {'Keys': [self._key(table, h, r) for h, r in chunk], 'ConsistentRead': consistent_read}
+            if attributes_to_get:
+                request['AttributesToGet'] = attributes_to_get
+            request_items = {table.name: request}
+            while request_items:
+                response = self.connection.batch_get_item(RequestItems=request_items)
+                results.extend(self._decode_item(i) for i in response.get('Responses', {}).get(table.name, []))
+                request_items = response.get('UnprocessedKeys')
+        return results
+
+    def _write(self, method, **kwargs):
+        """Make a write request, decoding any returned `Attributes`.
+        """
+        from botocore.exceptions import ClientError
+        try:
+            response = method(**kwargs)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                raise ConditionalCheckFailed(str(e))
+            raise
+        if 'Attributes' in response:
+            response['Attributes'] = self._decode_item(response['Attributes'])
+        return response
+
+    def put_item(self, table, attrs, expected_value=None, return_values=None):
+        return self._write(self.connection.put_item, TableName=table.name, Item=self._encode_item(attrs),
+                           **self._options(expected_value, return_values))
+
+    def update_item(self, table, hash_key, range_key, updates, expected_value=None, return_values=None):
+        attribute_updates = {}
+        for name, (action, value) in iteritems(updates):
+            attribute_updates[name] = {'Action': action}
+            if value is not None or action == 'PUT':
+                attribute_updates[name]['Value'] = self._encode(value)
+        return self._write(self.connection.update_item, TableName=table.name,
+                           Key=self._key(table, hash_key, range_key), AttributeUpdates=attribute_updates,
+                           **self._options(expected_value, return_values))
+
+    def delete_item(self, table, hash_key, range_key=None, expected_value=None, return_values=None):
+        return self._write(self.connection.delete_item, TableName=table.name,
+                           Key=self._key(table, hash_key, range_key),
+                           **self._options(expected_value, return_values))
+
+    def batch_write(self, table, puts=(), deletes=()):
+        requests = [{'PutRequest': {'Item': self._encode_item(attrs)}} for attrs in puts]
+        requests.extend({'DeleteRequest': {'Key': self._key(table, h, r)}} for h, r in deletes)
+        unprocessed_puts, unprocessed_deletes = [], []
+        for chunk in self._chunks(requests, 25):
+            response = self.connection.batch_write_item(RequestItems={table.name: chunk})
+            for request in response.get('UnprocessedItems', {}).get(table.name, []):
+                if 'PutRequest' in request:
+                    unprocessed_puts.append(self._decode_item(request['PutRequest']['Item']))
+                else:
+                    unprocessed_deletes.append(
+                        table.key_tuple(self._decode_item(request['DeleteRequest']['Key'])))
+        return unprocessed_puts, unprocessed_deletes
+
+    def _pages(self, table, method, params, max_results, request_limit):
+        remaining = max_results
+        while remaining is None or remaining > 0:
+            limit = self._limit(request_limit, remaining)
+            if limit is not None:
+                params['Limit'] = limit
+            response = method(**params)
+            page = self._truncate(table, [self._decode_item(i) for i in response.get('Items', [])],
+                                  self._last_evaluated_key(table, response), remaining)
+            yield page
+            if page.last_evaluated_key is None:
+                break
+            if remaining is not None:
+                remaining -= len(page.items)
+            params['ExclusiveStartKey'] = self._key(table, *page.last_evaluated_key)
+
+    def query(self, table, hash_key, range_key_condition=None, attributes_to_get=None, request_limit=None,
+              max_results=None, consistent_read=False, scan_index_forward=True, exclusive_start_key=None,
+              query_filter=None):
+        key_conditions = {table.hash_key_name: self._condition(EQ(hash_key))}
+        if range_key_condition:
+            key_conditions[table.range_key_name] = self._condition(range_key_condition)
+        params = dict(TableName=table.name, KeyConditions=key_conditions,
+                      ConsistentRead=consistent_read, ScanIndexForward=scan_index_forward)
+        if query_filter:
+            params['QueryFilter'] = dict((name, self._condition(c)) for name, c in iteritems(query_filter))
+        if attributes_to_get:
+            params['AttributesToGet'] = attributes_to_get
+        if exclusive_start_key:
+            params['ExclusiveStartKey'] = self._key(table, *exclusive_start_key)
+        return self._pages(table, self.connection.query, params, max_results, request_limit)
+
+    def scan(self, table, scan_filter=None, attributes_to_get=None, request_limit=None, max_results=None,
+             count=False, exclusive_start_key=None, segment=None, total_segments=None):
+        params = dict(TableName=table.name)
+        if total_segments is not None:
+            params.update(Segment=segment, TotalSegments=total_segments)
+        if scan_filter:
+            params['ScanFilter'] = dict((name, self._condition(c)) for name, c in iteritems(scan_filter))
+        if attributes_to_get:
+            params['AttributesToGet'] = attributes_to_get
+        if count:
+            params['Select'] = 'COUNT'
+        if exclusive_start_key:
+            params['ExclusiveStartKey'] = self._key(table, *exclusive_start_key)
+        return self._pages(table, self.connection.scan, params, max_results, request_limit)
+
+
+def _copy_attrs(attrs, attributes_to_get=None):
+    """Copy an item's attributes, so callers can't reach into stored sets.
+    """
+    return dict((name, set(value) if isinstance(value, (set, frozenset)) else value)
+                for name, value in iteritems(attrs)
+                if attributes_to_get is None or name in attributes_to_get)
+
+
+def _segment_of(hash_key, total_segments):
+    """Assign a hash key to a scan segment, the same way in every process.
+    """
+    return zlib.crc32(text_type(hash_key).encode('utf-8')) % total_segments
+
+
+class _MemoryTable(TableSchema):
+    """A table held in memory by the MemoryBackend.
+
+    Hash keys map straight to items on hash-only tables. On tables
+    with a range key, each hash key maps to a sorted list of its range
+    keys alongside a dict of items by range key, so range conditions
+    are a bisect away. A sorted list of hash keys gives scans the same
+    footing.
+    """
+    def __init__(self, name, hash_key_name, range_key_name=None):
+        super(_MemoryTable, self).__init__(name, hash_key_name, range_key_name)
+        self.hashes = {}
+        self.hash_keys = []
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        # Locks don't pickle; a copy (say, in a worker process) gets its own.
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def get(self, hash_key, range_key=None):
+        if self.range_key_name is None:
+            return self.hashes.get(hash_key)
+        try:
+            return self.hashes[hash_key][1].get(range_key)
+        except KeyError:
+            return None
+
+    def set(self, attrs):
+        hash_key, range_key = self.key_tuple(attrs)
+        if hash_key not in self.hashes:
+            bisect.insort(self.hash_keys, hash_key)
+        if self.range_key_name is None:
+            self.hashes[hash_key] = attrs
+        else:
+            range_keys, items = self.hashes.setdefault(hash_key, ([], {}))
+            if range_key not in items:
+                bisect.insort(range_keys, range_key)
+            items[range_key] = attrs
+
+    def remove(self, hash_key, range_key=None):
+        if self.range_key_name is None:
+            attrs = self.hashes.pop(hash_key, None)
+            if attrs is not None:
+                self._remove_hash_key(hash_key)
+            return attrs
+        try:
+            range_keys, items = self.hashes[hash_key]
+        except KeyError:
+            return None
+        attrs = items.pop(range_key, None)
+        if attrs is not None:
+            del range_keys[bisect.bisect_left(range_keys, range_key)]
+            if not items:
+                del self.hashes[hash_key]
+                self._remove_hash_key(hash_key)
+        return attrs
+
+    def _remove_hash_key(self, hash_key):
+        del self.hash_keys[bisect.bisect_left(self.hash_keys, hash_key)]
+
+    def check(self, hash_key, range_key, expected_value):
+        if not expected_value:
+            return
+        attrs = self.get(hash_key, range_key) or {}
+        for name, value in iteritems(expected_value):
+            if value is True:
+                ok = name in attrs
+            elif value is False:
+                ok = name not in attrs
+            else:
+                ok = attrs.get(name) == value
+            if not ok:
+                raise ConditionalCheckFailed('The conditional request failed on `%s`.' % name)
+
+    def range_slice(self, range_keys, condition):
+        """Find the `[lo, hi)` slice of sorted range keys matching a key condition.
+        """
+        if condition is None:
+            return 0, len(range_keys)
+        operator, arguments = _condition_args(condition)
+        if operator == 'EQ':
+            return bisect.bisect_left(range_keys, arguments[0]), bisect.bisect_right(range_keys, arguments[0])
+        elif operator == 'LE':
+            return 0, bisect.bisect_right(range_keys, arguments[0])
+        elif operator == 'LT':
+            return 0, bisect.bisect_left(range_keys, arguments[0])
+        elif operator == 'GE':
+            return bisect.bisect_left(range_keys, arguments[0]), len(range_keys)
+        elif operator == 'GT':
+            return bisect.bisect_right(range_keys, arguments[0]), len(range_keys)
+        elif operator == 'BETWEEN':
+            return bisect.bisect_left(range_keys, arguments[0]), bisect.bisect_right(range_keys, arguments[1])
+        elif operator == 'BEGINS_WITH':
+            lo = hi = bisect.bisect_left(range_keys, arguments[0])
+            while hi < len(range_keys) and range_keys[hi].startswith(arguments[0]):
+                hi += 1
+            return lo, hi
+        raise ValueError('%s is not a valid range key condition.' % operator)
+
+    def scan_keys(self, exclusive_start_key=None):
+        """Generate every `(hash_key, range_key)` in the table in key order.
+
+        Given `exclusive_start_key`, start just after it by position, so
+        a scan carries on in the right place even if the item it ended
+        its last page on has since been deleted.
+        """
+        with self.lock:
+            hash_keys = list(self.hash_keys)
+        start_hash = start_range = None
+        lo = 0
+        if exclusive_start_key:
+            start_hash = exclusive_start_key[0]
+            if self.range_key_name is None:
+                lo = bisect.bisect_right(hash_keys, start_hash)
+            else:
+                lo = bisect.bisect_left(hash_keys, start_hash)
+                start_range = exclusive_start_key[1]
+        for hash_key in hash_keys[lo:]:
+            if self.range_key_name is None:
+                yield hash_key, None
+                continue
+            with self.lock:
+                range_keys = list(self.hashes.get(hash_key, ((), None))[0])
+            first = bisect.bisect_right(range_keys, start_range) if hash_key == start_hash else 0
+            for range_key in range_keys[first:]:
+                yield hash_key, range_key
+
+
+class MemoryBackend(Backend):
+    """A backend that keeps its tables in memory, for tests and benchmarks.
+
+    There's no network and no serialization: items are stored as
+    dicts, range keys are kept sorted per hash key, and nothing
+    survives the process. Create tables before using them::
+
+        backend = duo.MemoryBackend()
+        backend.create_table('my_table', 'slug', 'date')
+        db = duo.DynamoDB(backend=backend)
+
+    Table handles are `TableSchema` objects. Parallel scans divide the
+    table up by hash key.
+    """
+    parallel_scan = True
+    thread_safe = True
+
+    def __init__(self, key=None, secret=None, **params):
+        super(MemoryBackend, self).__init__(key, secret, **params)
+        self.tables = {}
+
+    def connect(self):
+        return self
+
+    def create_table(self, table_name, hash_key_name, range_key_name=None):
+        self.tables[table_name] = _MemoryTable(table_name, hash_key_name, range_key_name)
+        return self.tables[table_name]
+
+    def delete_table(self, table_name):
+        del self.tables[table_name]
+
+    def get_table(self, table_name):
+        return self.tables[table_name]
+
+    def get_key_names(self, table):
+        return table.hash_key_name, table.range_key_name
+
+    def _return_values(self, old, new, updated, return_values):
+        if return_values == 'ALL_OLD' and old is not None:
+            return {'Attributes': _copy_attrs(old)}
+        elif return_values == 'ALL_NEW' and new is not None:
+            return {'Attributes': _copy_attrs(new)}
+        elif return_values == 'UPDATED_OLD' and old is not None:
+            return {'Attributes': _copy_attrs(old, updated)}
+        elif return_values == 'UPDATED_NEW' and new is not None:
+            return {'Attributes': _copy_attrs(new, updated)}
+        return {}
+
+    def get_item(self, table, hash_key, range_key=None, attributes_to_get=None, consistent_read=False):
+        with table.lock:
+            attrs = table.get(hash_key, range_key)
+            if attrs is None:
+                raise ItemNotFound((hash_key, range_key))
+            return _copy_attrs(attrs, attributes_to_get)
+
+    def batch_get(self, table, keys, attributes_to_get=None, consistent_read=False):
+        with table.lock:
+            found = (table.get(h, r) for h, r in keys)
+            return [_copy_attrs(attrs, attributes_to_get) for attrs in found if attrs is not None]
+
+    def put_item(self, table, attrs, expected_value=None, return_values=None):
+        hash_key, range_key = table.key_tuple(attrs)
+        with table.lock:
+            table.check(hash_key, range_key, expected_value)
+            old = table.get(hash_key, range_key)
+            table.set(_copy_attrs(attrs))
+        return self._return_values(old, None, None, return_values)
+
+    def update_item(self, table, hash_key, range_key, updates, expected_value=None, return_values=None):
+        with table.lock:
+            table.check(hash_key, range_key, expected_value)
+            old = table.get(hash_key, range_key)
+            new = _copy_attrs(old) if old is not None else table.key(hash_key, range_key)
+            for name, (action, value) in iteritems(updates):
+                if action == 'PUT':
+                    new[name] = set(value) if isinstance(value, (set, frozenset)) else value
+                elif action == 'ADD':
+                    if isinstance(value, (set, frozenset)):
+                        new[name] = new.get(name, set()) | set(value)
+                    else:
+                        new[name] = new.get(name, 0) + value
+                elif action == 'DELETE':
+                    if value is None:
+                        new.pop(name, None)
+                    elif name in new:
+                        new[name] = new[name] - set(value)
+                        if not new[name]:
+                            del new[name]
+                else:
+                    raise ValueError('Unknown update action %r.' % action)
+            table.set(new)
+        return self._return_values(old, new, set(updates), return_values)
+
+    def delete_item(self, table, hash_key, range_key=None, expected_value=None, return_values=None):
+        with table.lock:
+            table.check(hash_key, range_key, expected_value)
+            old = table.remove(hash_key, range_key)
+        return self._return_values(old, None, None, return_values)
+
+    def batch_write(self, table, puts=(), deletes=()):
+        with table.lock:
+            for attrs in puts:
+                table.set(_copy_attrs(attrs))
+            for hash_key, range_key in deletes:
+                table.remove(hash_key, range_key)
+        return [], []
+
+    def _pages(self, table, matches, max_results, request_limit, count=False, attributes_to_get=None):
+        """Page through `(key, attrs)` pairs the way DynamoDB would.
+
+        Like DynamoDB, `request_limit` counts items examined, not items
+        that made it through a filter.
+        """
+        remaining = max_results
+        if remaining is not None and remaining <= 0:
+            # Like the other backends, don't even ask.
+            return
+        page, examined, last_key = [], 0, None
+        for key, attrs, matched in matches:
+            examined += 1
+            last_key = key
+            if matched:
+                if not count:
+                    page.append(_copy_attrs(attrs, attributes_to_get))
+                if remaining is not None:
+                    remaining -= 1
+            if examined == request_limit or remaining == 0:
+                yield ResultPage(page, self._key_tuple(table, last_key))
+                if remaining == 0:
+                    return
+                page, examined = [], 0
+        yield ResultPage(page, None)
+
+    @staticmethod
+    def _key_tuple(table, key):
+        return key[:1] if table.range_key_name is None else key
+
+    def query(self, table, hash_key, range_key_condition=None, attributes_to_get=None, request_limit=None,
+              max_results=None, consistent_read=False, scan_index_forward=True, exclusive_start_key=None,
+              query_filter=None):
+        def matched(attrs):
+            return all(_condition_matches(c, attrs, name) for name, c in iteritems(query_filter or {}))
+
+        if table.range_key_name is None:
+            attrs = table.hashes.get(hash_key)
+            matches = [((hash_key, None), attrs, matched(attrs))] if attrs is not None else []
+            return self._pages(table, iter(matches), max_results, request_limit,
+                               attributes_to_get=attributes_to_get)
+
+        with table.lock:
+            range_keys, items = table.hashes.get(hash_key, ([], {}))
+            lo, hi = table.range_slice(range_keys, range_key_condition)
+            if exclusive_start_key:
+                if scan_index_forward:
+                    lo = max(lo, bisect.bisect_right(range_keys, exclusive_start_key[1]))
+                else:
+                    hi = min(hi, bisect.bisect_left(range_keys, exclusive_start_key[1]))
+            selected = range_keys[lo:hi]
+            if not scan_index_forward:
+                selected.reverse()
+            matches = [((hash_key, r), items[r], matched(items[r])) for r in selected]
+        return self._pages(table, iter(matches), max_results, request_limit,
+                           attributes_to_get=attributes_to_get)
+
+    def scan(self, table, scan_filter=None, attributes_to_get=None, request_limit=None, max_results=None,
+             count=False, exclusive_start_key=None, segment=None, total_segments=None):
+        def matches():
+            keys = table.scan_keys(exclusive_start_key)
+            if total_segments is not None:
+                keys = (k for k in keys if _segment_of(k[0], total_segments) == segment)
+            for key in keys:
+                attrs = table.get(*key)
+                if attrs is None:
+                    continue
+                matched = all(_condition_matches(c, attrs, name) for name, c in iteritems(scan_filter or {}))
+                yield key, attrs, matched
+
+        return self._pages(table, matches(), max_results, request_limit, count=count,
+                           attributes_to_get=attributes_to_get)
+
+
+# With a backend in hand, we need a way to manage a connection to
+# DynamoDB, and associate a custom table type with that connection.
+
+
+class DynamoDB(object):
+    """Manages a connection to DynamoDB and looks up custom Table handlers.
+
+    Example::
+
+        DYNAMODB = duo.DynamoDB(
+            key = getattr(os.environ.get('DYNAMODB_ACCESS_KEY_ID'), ''),
+            secret = getattr(os.environ.get('DYNAMODB_SECRET_ACCESS_KEY'), ''),
+            cache = cache  # pymemcached-compatible cache object.
+            )
+
+         # Assuming you've already declared a table named `my_table_name`:
+         my_table = DYNAMODB['my_table_name']
+
+    By default, duo talks to DynamoDB through `boto.dynamodb.layer2`.
+    Pass a `Backend` instance as `backend` to use something else::
+
+        DYNAMODB = duo.DynamoDB(backend=duo.Boto3Backend(region_name='us-west-2'))
+    """
+    def __init__(self, key=None, secret=None, cache=None, backend=None):
+        self.key = key
+        self.secret = secret
+        self._tables = {}
+        self.cache = cache
+        if backend is None:
+            backend = Layer2Backend(key, secret)
+        self.backend = backend
+
+    @property
+    def connection(self):
+        """The backend's underlying client connection.
+        """
+        return self.backend.connection
+
+    def reset(self):
+        """Reset the DynamoDB connection and clear any cached tables.
+        """
+        self.backend.reset()
+        self._tables.clear()
+
+    def __getitem__(self, table_name):
+        """Retrieve a registered custom table by name.
+        """
+        if hasattr(table_name, 'table_name'):
+            table_name = table_name.table_name
+
+        if table_name not in self._tables:
+            self._tables[table_name] = self.backend.get_table(table_name)
+
+        table = Table._table_types[table_name](self, self._tables[table_name], cache=self.cache)
+        table.table_name = table_name
+        return table
+
+
+# Another metaclass. This one's similar to the EnumMeta, but much
+# simpler: it's just a place to record subclasses of our Table and
+# Item mount-points.
+
+
+class _TableMeta(type):
+    """Metaclass plugin mount for plugins related to AWS DynamoDB tables.
+
+    Don't worry about using this one yourself. This is the magic that
+    glues your custom tables and your custom items together.
+    """
+    def __init__(cls, name, bases, attrs):
+        # Marty Alchin's simple plugin framework, again:
+        # http://martyalchin.com/2008/jan/10/simple-plugin-framework/
+        if not hasattr(cls, '_table_types'):
+            # This branch only executes when processing the mount point itself.
+            # So, since this is a new plugin mount, not an implementation, this
+            # class shouldn't be registered as a plugin. Instead, it sets up a
+            # registry where custom plugins can be registered later.
+            cls._table_types = collections.defaultdict(lambda: cls)
+        else:
+            # This must be a plugin implementation, which should be registered.
+            cls._table_types[cls.table_name] = cls
+
+    def _name_fields(cls):
+        """Tell this class's fields their names.
+
+        A field needs to know what its name is, but there's no need to
+        tell it until it's first used, so fields call this themselves.
+        That keeps defining classes cheap, for processes that never use
+        most of them.
+        """
+        for klass in cls.__mro__:
+            for name, value in iteritems(dict(vars(klass))):
+                if isinstance(value, Field) and value.name is None:
+                    value.name = name
+
+
+class Item(with_metaclass(_TableMeta, dict)):
+    """
+    A DynamoDB Item, with caching secret sauce.
+
+    Items are dicts of attribute values, which also keep track of
+    changes for `save()`, just like `boto.dynamodb.item.Item`.
+
+    Subclass to customize fields and caching behavior. Subclassing
+    auto-registers with the DB.
+
+    This is the mount-point for custom Items. Sub-classes will
+    register themselves with this mount-point.
+    """
+
+    duo_db = None
+    duo_table = None
+
+    table_name = None
+    cache = None
+    cache_duration = None
+    is_new = False
+
+    # For partial Items (from a projected query or scan), the names of
+    # the attributes we've fetched or set. None means we have them all.
+    _loaded = None
+    _siblings = ()
+
+    def __init__(self, table, hash_key=None, range_key=None, attrs=None):
+        # Field values decoded by `Field.to_python()`, by attribute
+        # name. Any write to an attribute throws its decoded value away.
+        self._decoded = {}
+        self._updates = None
+        self.duo_table = table
+        self.duo_db = table.duo_db
+        self.table = table.table
+        self._hash_key_name = table.hash_key_name
+        self._range_key_name = table.range_key_name
+
+        if attrs is None:
+            attrs = {}
+        if hash_key is None:
+            hash_key = attrs.get(self._hash_key_name, None)
+        self[self._hash_key_name] = hash_key
+        if self._range_key_name:
+            if range_key is None:
+                range_key = attrs.get(self._range_key_name, None)
+            self[self._range_key_name] = range_key
+
+        self._updates = {}
+        for key, value in iteritems(attrs):
+            if key != self._hash_key_name and key != self._range_key_name:
+                self[key] = value
+        self._original = self.copy()
+
+    def __setitem__(self, key, value):
+        self._decoded.pop(key, None)
+        if self._loaded is not None:
+            self._loaded.add(key)
+        if self._updates is not None:
+            self.put_attribute(key, value)
+        super(Item, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._decoded.pop(key, None)
+        if self._loaded is not None:
+            self._loaded.add(key)
+        if self._updates is not None:
+            self.delete_attribute(key)
+        super(Item, self).__delitem__(key)
+
+    # dict's own update(), setdefault() and friends skip __setitem__ and
+    # __delitem__; these don't, so they keep decoded values, loaded
+    # attributes and pending updates straight too.
+
+    def update(self, *args, **kwargs):
+        for key, value in iteritems(dict(*args, **kwargs)):
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def popitem(self):
+        for key in self:
+            return key, self.pop(key)
+        raise KeyError('popitem(): item is empty')
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def __missing__(self, key):
+        # Partial Items go and get attributes they haven't seen yet.
+        if self._loaded is not None and key not in self._loaded:
+            self._hydrate(key)
+            if key in self:
+                return super(Item, self).__getitem__(key)
+        raise KeyError(key)
+
+    @property
+    def is_partial(self):
+        """Did this item come from a projection, without all its attributes?
+        """
+        return self._loaded is not None
+
+    def _set_partial(self, attributes_to_get, siblings=()):
+        """Mark the item as holding only `attributes_to_get` (and its keys).
+
+        `siblings` are the other partial Items from the same page of
+        results, which will fetch missing attributes along with this one.
+        """
+        self._loaded = set(attributes_to_get) | set(self)
+        self._siblings = siblings
+
+    def _hydrate(self, name=None):
+        """Fetch attributes that a projection left out.
+
+        With a `name`, fetch just that attribute, for this item and each
+        sibling still missing it, in one batch. Without, fetch everything
+        this item is missing. Values set locally in the meantime win.
+        """
+        table = self.duo_table
+        keys = [n for n in (self.hash_key_name, self.range_key_name) if n is not None]
+        if name is None:
+            items = [self]
+            attributes_to_get = None
+        else:
+            items = [i for i in self._siblings if i._loaded is not None and name not in i._loaded]
+            if not any(i is self for i in items):
+                items.append(self)
+            attributes_to_get = [name] + keys
+
+        by_key = dict(((i._stored_hash_key, i.range_key), i) for i in items)
+        for attrs in table.backend.batch_get(table.table, list(by_key), attributes_to_get):
+            key = (attrs.get(self.hash_key_name), attrs.get(self.range_key_name))
+            item = by_key.get(key)
+            if item is None:
+                continue
+            for attr_name, value in iteritems(attrs):
+                if attr_name not in item._loaded:
+                    dict.__setitem__(item, attr_name, value)
+                    item._original[attr_name] = value
+
+        for item in items:
+            if name is None:
+                item._loaded = None
+                item._siblings = ()
+            else:
+                item._loaded.add(name)
+
+    @property
+    def hash_key(self):
+        """The item's hash key, as you'd look it up: on a sharded hash key, without the shard.
+        """
+        return self.duo_table._logical_hash_key(self._stored_hash_key)
+
+    @property
+    def _stored_hash_key(self):
+        return self[self._hash_key_name]
+
+    @property
+    def range_key(self):
+        return self.get(self._range_key_name)
+
+    @property
+    def hash_key_name(self):
+        return self._hash_key_name
+
+    @property
+    def range_key_name(self):
+        return self._range_key_name
+
+    def add_attribute(self, attr_name, attr_value):
+        """Queue an increment of a numeric attribute (or addition to a set) for `save()`.
+        """
+        self._updates[attr_name] = ('ADD', attr_value)
+
+    def delete_attribute(self, attr_name, attr_value=None):
+        """Queue removal of an attribute (or of values from a set) for `save()`.
+        """
+        self._updates[attr_name] = ('DELETE', attr_value)
+
+    def put_attribute(self, attr_name, attr_value):
+        """Queue a new value of an attribute for `save()`.
+        """
+        self._updates[attr_name] = ('PUT', attr_value)
+
+    @property
+    def dynamo_key(self):
+        """Return the hash_key or (hash_key, range_key) key.
+
+        The returned value is suitable for looking up the item in the
+        table via __getitem__(key)
+        """
+        if self.range_key_name is None:
+            return self.hash_key
+        else:
+            return (self.hash_key, self.range_key)
+
+    @property
+    def _cache_key(self):
+        """Determine the key for accessing the item in the cache.
+        """
+        return self.duo_table._get_cache_key(self._stored_hash_key, self.range_key)
+
+    def _set_cache(self):
+        """Store the item in the cache, unless it's partial.
+        """
+        if self.cache is not None and self.cache_duration is not None and self._loaded is None:
+            table = self.duo_table
+            key = table._get_cache_key(self._stored_hash_key, self.range_key)
+            duration = self.cache_duration if self.cache_duration is not None else table.cache_duration
+            self.cache.set(key, list(self.items()), duration)
+
+    def _delete_cache(self):
+        """Remove the item from the cache.
+        """
+        if self.cache is not None:
+            table = self.duo_table
+            key = table._get_cache_key(self._stored_hash_key, self.range_key)
+            self.cache.delete(key)
+
+    def increment(self, name, n=1):
+        """Atomically add `n` to a numeric attribute, without reading the item first.
+
+        The item is created if need be. Returns the attribute's new
+        value, which is also set on this Item.
+        """
+        if name in (self.hash_key_name, self.range_key_name):
+            raise AttributeError('Cannot increment key `%s`!' % name)
+        result = self.duo_table.backend.update_item(self.table, self._stored_hash_key, self.range_key,
+                                                    {name: ('ADD', n)}, return_values='UPDATED_NEW')
+        value = result.get('Attributes', {}).get(name)
+        # Record the new value as stored, not as a change to save.
+        self._updates.pop(name, None)
+        self._decoded.pop(name, None)
+        if self._loaded is not None:
+            self._loaded.add(name)
+        super(Item, self).__setitem__(name, value)
+        self._original[name] = value
+        self.is_new = False
+        try:
+            self._delete_cache()
+        except Exception as e:
+            warnings.warn('Cache write-through failed on increment(). %s: %s' % (e.__class__.__name__, e))
+        try:
+            self.duo_table._bump_query_generation(self._stored_hash_key)
+        except Exception as e:
+            warnings.warn('Query cache invalidation failed on increment(). %s: %s' % (e.__class__.__name__, e))
+        self._write_mirror('increment', exact=self._loaded is None)
+        return value
+
+    def _write_mirror(self, method, exact):
+        """Bring the table's mirror, if any, up to date with a write.
+
+        If this Item isn't `exact`ly what's stored now, the item is
+        read back from DynamoDB first.
+        """
+        table = self.duo_table
+        if table.mirror is None:
+            return
+        try:
+            if exact:
+                table.mirror.store(table, self)
+                return
+            try:
+                attrs = table.backend.get_item(table.table, self._stored_hash_key, self.range_key,
+                                               consistent_read=True)
+            except ItemNotFound:
+                table.mirror.discard(self._stored_hash_key, self.range_key)
+            else:
+                table.mirror.store(table, attrs)
+        except Exception as e:
+            warnings.warn('Mirror write-through failed on %s(). %s: %s' % (method, e.__class__.__name__, e))
+
+    @classmethod
+    def _version_name(cls):
+        """Find the name of this class's VersionField, or None if it hasn't one.
+        """
+        if '_version_field_name' not in vars(cls):
+            names = [name for klass in cls.__mro__ for name, value in iteritems(dict(vars(klass)))
+                     if isinstance(value, VersionField)]
+            cls._version_field_name = names[0] if names else None
+        return cls._version_field_name
+
+    def _write_versioned(self, write, expected_value):
+        """Make a write, moving the item's VersionField on if it has one.
+
+        Unless the caller has expectations of their own, the version
+        we read is the write's only condition, and a failed condition
+        is a VersionConflict. Either way, a failed write leaves the
+        version as it was.
+        """
+        name = self._version_name()
+        if name is None:
+            return write(expected_value)
+        if self._loaded is not None and name not in self._loaded:
+            self._hydrate(name)
+        version = self._original.get(name)
+        own = {name: False if version is None else version}
+        guarded = expected_value is None or expected_value == own
+        if guarded:
+            expected_value = own
+        self[name] = (version or 0) + 1
+        try:
+            result = write(expected_value)
+        except ConditionalCheckFailed:
+            self._updates.pop(name, None)
+            self._decoded.pop(name, None)
+            if version is None:
+                dict.pop(self, name, None)
+            else:
+                dict.__setitem__(self, name, version)
+            if guarded:
+                raise VersionConflict('%r is no longer at version %s.' % (self.dynamo_key, version))
+            raise
+        self._original[name] = self[name]
+        return result
+
+    def get_expected(self):
+        """Get a dictionary of original values for the object, with new attributes filled in w/ False.
+
+        This is useful for the `expected_value` argument to put/save.
+        Items with a VersionField expect just their original version.
+        """
+        name = self._version_name()
+        if name is not None:
+            return {name: self._original.get(name, False)}
+        expected = {}
+        for key in self:
+            expected[key] = False
+        if not self.is_new:
+            # A new Item's original values were never stored.
+            expected.update(self._original)
+        return expected
+
+    def put(self, expected_value=None, return_values=None):
+        """Put the item in the database, and also in the cache.
+
+        A partial item fetches the rest of itself first, so as not to
+        put a fraction of the item in place of the whole.
+        """
+        if self._loaded is not None:
+            self._hydrate()
+        backend = self.duo_table.backend
+        result = self._write_versioned(
+            lambda expected: backend.put_item(self.table, dict(self), expected, return_values), expected_value)
+        self._updates.clear()
+        self.is_new = False
+        try:
+            self._set_cache()
+        except Exception as e:
+            warnings.warn('Cache write-through failed on put(). %s: %s' % (e.__class__.__name__, e))
+        try:
+            self.duo_table._bump_query_generation(self._stored_hash_key)
+        except Exception as e:
+            warnings.warn('Query cache invalidation failed on put(). %s: %s' % (e.__class__.__name__, e))
+        self._write_mirror('put', exact=True)
+        return result
+
+    def put_conditionally(self, *args, **kwargs):
+        """Put the item in the database, but only if the original values still hold.
+        """
+        kwargs['expected_value'] = self.get_expected()
+        return self.put(*args, **kwargs)
+
+    def save(self, expected_value=None, return_values=None):
+        """Save the item in the database, and also in the cache.
+        """
+        # Only PUTs and whole-attribute DELETEs are reflected locally.
+        exact = self._loaded is None and all(action == 'PUT' or value is None
+                                             for action, value in self._updates.values())
+        backend = self.duo_table.backend
+        result = self._write_versioned(
+            lambda expected: backend.update_item(self.table, self._stored_hash_key, self.range_key, self._updates,
+                                                 expected, return_values),
+            expected_value)
+        self._updates.clear()
+        self.is_new = False
+        try:
+            self._set_cache()
+        except Exception as e:
+            warnings.warn('Cache write-through failed on save(). %s: %s' % (e.__class__.__name__, e))
+        try:
+            self.duo_table._bump_query_generation(self._stored_hash_key)
+        except Exception as e:
+            warnings.warn('Query cache invalidation failed on save(). %s: %s' % (e.__class__.__name__, e))
+        self._write_mirror('save', exact)
+        return result
+
+    def save_conditionally(self, *args, **kwargs):
+        """Save the updated item in the database, but only if the original values still hold.
+        """
+        kwargs['expected_value'] = self.get_expected()
+        return self.save(*args, **kwargs)
+
+    def delete(self, expected_value=None, return_values=None):
+        """Delete the item from the database, and also from the cache.
+        """
+        result = self.duo_table.backend.delete_item(self.table, self._stored_hash_key, self.range_key,
+                                                    expected_value, return_values)
+        self.is_new = True
+        try:
+            self._delete_cache()
+        except Exception as e:
+            warnings.warn('Cache write-through failed on delete(). %s: %s' % (e.__class__.__name__, e))
+        try:
+            self.duo_table._bump_query_generation(self._stored_hash_key)
+        except Exception as e:
+            warnings.warn('Query cache invalidation failed on delete(). %s: %s' % (e.__class__.__name__, e))
+        if self.duo_table.mirror is not None:
+            try:
+                self.duo_table.mirror.discard(self._stored_hash_key, self.range_key)
+            except Exception as e:
+                warnings.warn('Mirror write-through failed on delete(). %s: %s' % (e.__class__.__name__, e))
+        return result
+
+
+def _bounded_cache_key(key, max_length=250):
+    """Make a cache key memcached will take, hashing it to a fixed length if need be.
+
+    Keys that are too long, or that have spaces, control characters or
+    anything outside ASCII, come back as `'sha1_<hex digest>'`.
+    """
+    encoded = key.encode('utf-8') if isinstance(key, text_type) else key
+    if len(encoded) <= max_length and all(32 < c < 127 for c in bytearray(encoded)):
+        return key
+    return 'sha1_%s' % hashlib.sha1(encoded).hexdigest()
+
+
+class Table(with_metaclass(_TableMeta, object)):
+    """
+    A DynamoDB Table, with super dict-like powers.
+
+    Subclass to customize behavior. Subclassing auto-registers with
+    the DB.
+
+    This is the mount-point for custom Tables. Sub-classes will
+    register themselves with this mount-point.
+    """
+
+    table_name = None
+    hash_key_name = None
+    range_key_name = None
+
+    cache = None
+    cache_prefix = None
+    query_cache_duration = None
+    cache_results = False
+    mirror = None
+    cursor_secret = None
+    cursor_max_requests = 10
+    versioned_cache_keys = False
+    max_cache_key_length = 250
+    write_shards = None
+    sharded_hash_keys = None
+    random_shards = False
+
+    def __init__(self, db, table, cache=None):
+        self.duo_db = db
+        self.backend = db.backend
+        self.table = table
+        if self.cache is None:
+            self.cache = cache
+        if self.hash_key_name is None:
+            # Not declared, so ask DynamoDB.
+            self.hash_key_name, self.range_key_name = self.backend.get_key_names(table)
+        super(Table, self).__init__()
+
+    def keys(self):
+        """Return an iterator of object keys, either by `hash_key` or `(hash_key, range_key)`.
+
+        WARNING: This performs a table scan, which can be expensive on a large table.
+        """
+        if self.range_key_name is None:
+            return (i[self.hash_key_name] for i in self.scan(attributes_to_get=[self.hash_key_name]))
+        else:
+            return ((i[self.hash_key_name], i[self.range_key_name])
+                    for i in self.scan(attributes_to_get=[self.hash_key_name, self.range_key_name]))
+
+    def items(self):
+        """Return an iterator of object key/value pairs, either by `hash_key` or `(hash_key, range_key)`.
+
+        WARNING: This performs a table scan, which can be expensive on a large table.
+        """
+        if self.range_key_name is None:
+            return ((i[self.hash_key_name], i) for i in self.scan())
+        else:
+            return (((i[self.hash_key_name], i[self.range_key_name]), i)
+                    for i in self.scan())
+
+    def values(self):
+        """Return an iterator of objects in the table.
+
+        Equivalent of `.scan()` sans arguments.
+
+        WARNING: This performs a table scan, which can be expensive on a large table.
+        """
+        return self.scan()
+
+    @property
+    def item_class(self):
+        """The registered Item subclass for this table.
+        """
+        return Item._table_types[self.table_name]
+
+    def create(self, hash_key, range_key=None, **kwargs):
+        """Create an item given the specified attributes.
+
+        On a sharded hash key, the item is created on one of its shards.
+        """
+        return self._create(self._write_hash_key(hash_key, range_key), range_key, **kwargs)
+
+    def _create(self, hash_key, range_key=None, **kwargs):
+        item = self.item_class(self, hash_key=hash_key, range_key=range_key, attrs=kwargs)
+        return self._extend(item, is_new=True)
+
+    def _extend(self, item, is_new=False):
+        """Extend the given Item with some necessary attributes.
+        """
+        item.is_new = is_new
+        item.cache = self.cache
+        item.duo_table = self
+        item.duo_db = self.duo_db
+        return item
+
+    def _extend_pages(self, pages, attributes_to_get=None):
+        """Build extended Items from pages of backend results.
+
+        With `attributes_to_get`, the Items are partial: each page's
+        Items fetch whatever else is asked of them together.
+        """
+        item_class = self.item_class
+        for page in pages:
+            # Build the whole page before yielding any of it, so that
+            # each Item knows all its siblings, even while streaming.
+            items = [self._extend(item_class(self, attrs=attrs)) for attrs in page.items]
+            if attributes_to_get is not None:
+                for item in items:
+                    item._set_partial(attributes_to_get, items)
+            for item in items:
+                yield item
+
+    def _cache_namespace(self):
+        """Determine the prefix for this table's cache keys.
+
+        If the table sets `versioned_cache_keys`, the prefix carries the
+        table's namespace version, which `invalidate_cache()` moves on.
+        """
+        prefix = self.cache_prefix or self.table_name
+        if self.versioned_cache_keys and self.cache is not None:
+            prefix = '%s_v%s' % (prefix, self._cache_counter(self._get_namespace_key()))
+        return prefix
+
+    def _get_namespace_key(self):
+        """Determine the cache key for this table's namespace version.
+        """
+        return _bounded_cache_key('%s:namespace' % (self.cache_prefix or self.table_name),
+                                  self.max_cache_key_length)
+
+    def _get_cache_key(self, hash_key, range_key, namespace=None):
+        """Determine the cache key for a given table key.
+
+        Specify `range_key=None` for a hash-only key. Pass `namespace`
+        to save looking it up again when building several keys.
+        """
+        if namespace is None:
+            namespace = self._cache_namespace()
+        if range_key is None:
+            key = '%s_%s' % (namespace, hash_key)
+        else:
+            key = '%s_%s_%s' % (namespace, hash_key, range_key)
+        return _bounded_cache_key(key, self.max_cache_key_length)
+
+    # Item cache keys are `<namespace>_<key>`; the query cache's own keys
+    # are `<namespace>:<kind>_<key>`, so no item key can collide with one.
+
+    def _get_generation_key(self, hash_key):
+        """Determine the cache key for a hash key's query generation.
+        """
+        return _bounded_cache_key('%s:generation_%s' % (self._cache_namespace(), hash_key),
+                                  self.max_cache_key_length)
+
+    def _cache_counter(self, key):
+        """Find the current value of a cached counter, starting one if need be.
+        """
+        value = self.cache.get(key)
+        if value is None:
+            # Start somewhere random, not zero, so that a counter lost
+            # to eviction doesn't come back around to a value that's
+            # been used.
+            start = random.getrandbits(48)
+            self.cache.add(key, start, 0)
+            value = self.cache.get(key)
+            if value is None:
+                # Still missing (evicted already, or the cache is
+                # down): carry on with a value no one else has used,
+                # which is as good as a new version.
+                value = start
+        return value
+
+    def _bump_cache_counter(self, key):
+        """Move a cached counter on, invalidating every key built from it.
+        """
+        try:
+            value = self.cache.incr(key)
+        except Exception:
+            # Some clients raise, rather than return None, for a missing key.
+            value = None
+        if value is None:
+            self.cache.set(key, random.getrandbits(48), 0)
+
+    def _get_generation(self, hash_key):
+        """Find the current query generation for a hash key, starting one if need be.
+        """
+        return self._cache_counter(self._get_generation_key(hash_key))
+
+    def _bump_query_generation(self, hash_key):
+        """Invalidate every cached query on a hash key, by moving on to a new generation.
+        """
+        if self.cache is None or self.query_cache_duration is None:
+            return
+        self._bump_cache_counter(self._get_generation_key(hash_key))
+
+    def invalidate_cache(self):
+        """Invalidate every cached item and query for this table at once.
+
+        This moves the table on to a new namespace version, so it needs
+        `versioned_cache_keys`. Old entries aren't deleted; they're just
+        never asked for again, and the cache will evict them in time.
+        """
+        if self.cache is None:
+            return
+        if not self.versioned_cache_keys:
+            raise ValueError('%s needs versioned_cache_keys to invalidate its cache.' % self.__class__.__name__)
+        self._bump_cache_counter(self._get_namespace_key())
+
+    def _get_query_cache_key(self, hash_key, generation, params, page=0):
+        """Determine the cache key for a page of a query's results, in a given generation.
+        """
+        canonical = dict(params)
+        if canonical.get('range_key_condition') is not None:
+            canonical['range_key_condition'] = _condition_args(canonical['range_key_condition'])
+        if canonical.get('query_filter'):
+            canonical['query_filter'] = sorted((name, _condition_args(c))
+                                               for name, c in iteritems(canonical['query_filter']))
+        digest = hashlib.sha1(json.dumps(canonical, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+        return _bounded_cache_key('%s:query_%s_%s_%s_%s' % (self._cache_namespace(), hash_key, generation, digest,
+                                                           page),
+                                  self.max_cache_key_length)
+
+    def _cached_query(self, hash_key, params):
+        """Run a query through the query cache, generating ResultPages.
+
+        Cached results stay good until their generation moves on, when
+        an item with the same hash key is written or deleted. Each page
+        is cached on its own, so no one cache value grows with the
+        query; if a page has gone, the query carries on from DynamoDB
+        where the last cached page left off. If the cache is down, so
+        is caching, but the query still works.
+        """
+        try:
+            generation = self._get_generation(hash_key)
+        except Exception as e:
+            warnings.warn('Query cache lookup failed. %s: %s' % (e.__class__.__name__, e))
+            generation = None
+        if generation is None:
+            for page in self._backend_query(hash_key, **params):
+                yield page
+            return
+
+        remaining = params.get('max_results')
+        exclusive_start_key = params.get('exclusive_start_key')
+        number = 0
+        while True:
+            try:
+                cached = self.cache.get(self._get_query_cache_key(hash_key, generation, params, number))
+            except Exception as e:
+                warnings.warn('Query cache lookup failed. %s: %s' % (e.__class__.__name__, e))
+                cached = None
+            if cached is None:
+                break
+            page = ResultPage(*cached)
+            yield page
+            number += 1
+            if remaining is not None:
+                remaining -= len(page.items)
+            if page.last_evaluated_key is None or remaining == 0:
+                return
+            exclusive_start_key = page.last_evaluated_key
+
+        resumed = dict(params, exclusive_start_key=exclusive_start_key, max_results=remaining)
+        for page in self._backend_query(hash_key, **resumed):
+            try:
+                self.cache.set(self._get_query_cache_key(hash_key, generation, params, number), tuple(page),
+                               self.query_cache_duration)
+            except Exception as e:
+                warnings.warn('Query cache write failed. %s: %s' % (e.__class__.__name__, e))
+            number += 1
+            yield page
+
+    def _backend_query(self, hash_key, **params):
+        return self._cache_results(self.backend.query(self.table, hash_key, **params),
+                                   params.get('attributes_to_get'))
+
+    def _cache_results(self, pages, attributes_to_get=None):
+        """Pass pages of results through, caching each page's items in one go.
+
+        Only if the table sets `cache_results`, and the Items have a
+        `cache_duration`; partial items, from `attributes_to_get`,
+        aren't cached.
+        """
+        duration = self.item_class.cache_duration
+        if not self.cache_results or self.cache is None or duration is None or attributes_to_get is not None:
+            for page in pages:
+                yield page
+            return
+
+        for page in pages:
+            if page.items:
+                namespace = self._cache_namespace()
+                mapping = dict((self._get_cache_key(*self._key_of(attrs), namespace=namespace),
+                                list(attrs.items()))
+                               for attrs in page.items)
+                try:
+                    if hasattr(self.cache, 'set_multi'):
+                        self.cache.set_multi(mapping, duration)
+                    else:
+                        for key, value in iteritems(mapping):
+                            self.cache.set(key, value, duration)
+                except Exception as e:
+                    warnings.warn('Caching results failed. %s: %s' % (e.__class__.__name__, e))
+            yield page
+
+    def _key_of(self, attrs):
+        return attrs[self.hash_key_name], attrs[self.range_key_name] if self.range_key_name else None
+
+    def _get_cache(self, hash_key, range_key=None):
+        """Retrieve the specified item from the cache, if available.
+        """
+        if self.cache is None:
+            return None
+        else:
+            key = self._get_cache_key(hash_key, range_key)
+            cached = self.cache.get(key)
+            if cached is not None:
+                # Build an Item.
+                cached = self._extend(
+                    self.item_class(
+                        self,
+                        hash_key = hash_key,
+                        range_key = range_key,
+                        attrs = dict(cached)
+                    ))
+            return cached
+
+    def get_item(self, hash_key, range_key=None, **params):
+        """Retrieve an item by key, raising ItemNotFound if it doesn't exist.
+
+        Accepts `attributes_to_get` and `consistent_read`.
+        """
+        if range_key is not None and self._is_sharded(hash_key):
+            if not self.random_shards:
+                return self._get_item(self._write_hash_key(hash_key, range_key), range_key, **params)
+            item = self._find_sharded(hash_key, range_key, **params)
+            if item is None:
+                raise ItemNotFound((hash_key, range_key))
+            return item
+        return self._get_item(hash_key, range_key, **params)
+
+    def _get_item(self, hash_key, range_key=None, **params):
+        item = self._extend(
+            self.item_class(
+                self,
+                hash_key = hash_key,
+                range_key = range_key,
+                attrs = self.backend.get_item(self.table, hash_key, range_key, **params)
+            )
+        )
+        if params.get('attributes_to_get') is not None:
+            item._set_partial(params['attributes_to_get'])
+        item._set_cache()
+        return item
+
+    def retry_on_conflict(self, key, update, attempts=3):
+        """Apply `update(item)` to an item and save it, rereading and retrying on a VersionConflict.
+
+        `key` is a hash key or a `(hash_key, range_key)` tuple. Each
+        attempt reads the item afresh, consistently, so `update` may be
+        called more than once. Returns the saved Item; the last attempt's
+        VersionConflict propagates.
+        """
+        if attempts < 1:
+            raise ValueError('retry_on_conflict needs at least one attempt, not %r.' % (attempts,))
+        hash_key, range_key = key if isinstance(key, tuple) else (key, None)
+        for attempt in range(attempts):
+            try:
+                item = self.get_item(hash_key, range_key, consistent_read=True)
+            except ItemNotFound:
+                item = self.create(hash_key, range_key)
+            update(item)
+            try:
+                item.save()
+            except VersionConflict:
+                if attempt == attempts - 1:
+                    raise
+            else:
+                return item
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            hash_key, range_key = key
+        else:
+            hash_key = key
+            range_key = None
+
+        if range_key is not None and self._is_sharded(hash_key):
+            if self.random_shards:
+                item = self._find_sharded(hash_key, range_key)
+                return item if item is not None else self.create(hash_key, range_key)
+            hash_key = self._write_hash_key(hash_key, range_key)
+
+        if self.mirror is not None and self.mirror.ensure_fresh(self):
+            return self._get_mirrored(hash_key, range_key)
+
+        # Check the cache first.
+        cached = self._get_cache(hash_key, range_key)
+        if cached is not None:
+            return cached
+
+        try:
+            if range_key is None:
+                if self.range_key_name is None:
+                    item = self._get_item(hash_key)
+                else:
+                    return self.query(hash_key)
+            else:
+                item = self._get_item(hash_key, range_key)
+        except ItemNotFound:
+            item = self._create(hash_key, range_key)
+
+        if hasattr(item, 'is_new') and not item.is_new:
+            item._set_cache()
+
+        return item
+
+    def _get_mirrored(self, hash_key, range_key=None):
+        """Look up an item in the table's mirror, once `ensure_fresh()` says it's ready.
+        """
+        if range_key is None and self.range_key_name is not None:
+            if self._is_sharded(hash_key):
+                shards = [self.mirror.query(_shard_key(hash_key, shard)) for shard in range(self.write_shards)]
+                rows = _merge_sorted(shards, lambda attrs: attrs[self.range_key_name])
+            else:
+                rows = self.mirror.query(hash_key)
+            return (self._extend(self.item_class(self, attrs=attrs)) for attrs in rows)
+        attrs = self.mirror.get(hash_key, range_key)
+        if attrs is None:
+            return self._create(hash_key, range_key)
+        return self._extend(self.item_class(self, attrs=attrs))
+
+    def query(self, hash_key, range_key_condition=None,
+              attributes_to_get=None, request_limit=None,
+              max_results=None, consistent_read=False,
+              scan_index_forward=True, exclusive_start_key=None, query_filter=None):
+        """Perform a query on the table.
+
+        Returns items using the registered subclass, if one has been registered.
+
+        If the table sets a `query_cache_duration` and has a cache,
+        results are cached, and come back from the cache until an item
+        with the same hash key is written or deleted through duo.
+        Consistent reads always go to DynamoDB.
+
+        A sharded hash key's shards are all queried at once, in
+        threads, and their Items merged in range key order.
+
+        See http://boto.readthedocs.org/en/latest/ref/dynamodb.html#boto.dynamodb.table.Table.query
+        """
+        params = dict(
+            range_key_condition = range_key_condition,
+            attributes_to_get = attributes_to_get,
+            request_limit = request_limit,
+            max_results = max_results,
+            scan_index_forward = scan_index_forward,
+            exclusive_start_key = exclusive_start_key,
+            query_filter = query_filter,
+        )
+        if self._is_sharded(hash_key):
+            return self._scatter_query(hash_key, consistent_read, params)
+        return self._extend_pages(self._query_pages(hash_key, consistent_read=consistent_read, **params),
+                                  attributes_to_get)
+
+    # Write sharding spreads a hot hash key's items over several hash
+    # keys, `'<hash_key>#0'` to `'<hash_key>#<write_shards - 1>'`, so
+    # they aren't all on one partition. Create, look up and query
+    # items by the logical hash key; duo finds the shards.
+
+    def _is_sharded(self, hash_key):
+        """Is this logical hash key spread over shards?
+        """
+        return bool(self.write_shards) and (self.sharded_hash_keys is None or hash_key in self.sharded_hash_keys)
+
+    def _logical_hash_key(self, hash_key):
+        """Take the shard off a stored hash key, if it has one.
+        """
+        if self.write_shards and isinstance(hash_key, string_types):
+            logical, _, shard = hash_key.rpartition('#')
+            if shard.isdigit() and int(shard) < self.write_shards and self._is_sharded(logical):
+                return logical
+        return hash_key
+
+    def _write_hash_key(self, hash_key, range_key):
+        """Determine the hash key a new item is stored under.
+
+        On a sharded hash key, that's the shard its range key hashes to,
+        so the item can be found again without a query, or a random one
+        if the table sets `random_shards`.
+        """
+        if range_key is None or not self._is_sharded(hash_key):
+            return hash_key
+        if self.random_shards:
+            shard = random.randrange(self.write_shards)
+        else:
+            shard = _segment_of(range_key, self.write_shards)
+        return _shard_key(hash_key, shard)
+
+    def _find_sharded(self, hash_key, range_key, attributes_to_get=None, consistent_read=False):
+        """Look for an item on every shard of a hash key, returning None if it isn't on any.
+        """
+        items = self.query(hash_key, range_key_condition=EQ(range_key), attributes_to_get=attributes_to_get,
+                           consistent_read=consistent_read, max_results=1)
+        for item in items:
+            return item
+        return None
+
+    def _scatter_query(self, hash_key, consistent_read, params):
+        """Query every shard of a hash key at once, merging their Items in range key order.
+
+        Each shard is queried in a thread of its own, a bounded way
+        ahead of the merge, so results stream in without any shard's
+        being held in memory whole. An `exclusive_start_key` carries on
+        from its range key on every shard.
+
+        Threads go straight to the backend, each with its own copy
+        unless the backend is `thread_safe`, and leave the cache alone,
+        since cache clients can't be assumed to be thread-safe either.
+        So sharded queries aren't cached.
+        """
+        start = params.pop('exclusive_start_key')
+        streams = []
+        for shard in range(self.write_shards):
+            backend = self.backend if self.backend.thread_safe else copy.copy(self.backend)
+            streams.append(_Prefetch(partial(self._query_shard, backend, _shard_key(hash_key, shard),
+                                             consistent_read, start, params)))
+        try:
+            items = _merge_sorted(streams, lambda item: item.range_key, reverse=not params['scan_index_forward'])
+            for item in itertools.islice(items, params['max_results']):
+                yield item
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def _query_shard(self, backend, shard_key, consistent_read, start, params):
+        pages = backend.query(self.table, shard_key, consistent_read=consistent_read,
+                              exclusive_start_key=(shard_key, start[1]) if start else None, **params)
+        return self._extend_pages(pages, params['attributes_to_get'])
+
+    def _query_pages(self, hash_key, consistent_read=False, **params):
+        """Generate pages of query results, by way of the query cache if there is one.
+        """
+        if self.cache is not None and self.query_cache_duration is not None and not consistent_read:
+            return self._cached_query(hash_key, params)
+        else:
+            return self._backend_query(hash_key, consistent_read=consistent_read, **params)
+
+    def filter(self, *conditions):
+        """Start a query built from Field comparisons.
+
+        Example::
+
+            table.filter(MyItem.slug == 'fred', MyItem.on_this_date >= today).only(MyItem.my_field)
+
+        See `Query`.
+        """
+        return Query(self).filter(*conditions)
+
+    def scan(self, scan_filter=None, attributes_to_get=None, request_limit=None, max_results=None, count=False,
+             exclusive_start_key=None, segment=None, total_segments=None):
+        """Scan through this table.
+
+        This is a very long and expensive operation, and should be avoided if at all possible.
 
         Returns items using the registered subclass, if one has been registered.
 
-        See http://boto.readthedocs.org/en/latest/ref/dynamodb.html#boto.dynamodb.table.Table.query
+        See http://boto.readthedocs.org/en/latest/ref/dynamodb.html#boto.dynamodb.table.Table.scan
+        """
+        return self._extend_pages(
+            self._scan_pages(scan_filter=scan_filter, attributes_to_get=attributes_to_get,
+                             request_limit=request_limit, max_results=max_results, count=count,
+                             exclusive_start_key=exclusive_start_key, segment=segment,
+                             total_segments=total_segments),
+            attributes_to_get)
+
+    def _scan_pages(self, **params):
+        return self._cache_results(self.backend.scan(self.table, **params), params.get('attributes_to_get'))
+
+    def query_page(self, hash_key, page_size, range_key_condition=None, attributes_to_get=None,
+                   consistent_read=False, scan_index_forward=True, query_filter=None):
+        """Query for one page of Items, returning a `CursorPage`.
+
+        Pass the page's `cursor` to `page()` for the next one. The
+        table needs a `cursor_secret` to sign cursors with. A page
+        stops after `cursor_max_requests` requests to DynamoDB, so a
+        filter that discards most items can make it come back short,
+        even empty, with a cursor for the rest.
+        """
+        if self._is_sharded(hash_key):
+            raise ValueError('Cursors cannot page through the sharded hash key %r; use query().' % (hash_key,))
+        params = dict(hash_key=hash_key, range_key_condition=range_key_condition,
+                      attributes_to_get=attributes_to_get, consistent_read=consistent_read,
+                      scan_index_forward=scan_index_forward, query_filter=query_filter)
+        return self._cursor_page('query', params, page_size)
+
+    def scan_page(self, page_size, scan_filter=None, attributes_to_get=None):
+        """Scan for one page of Items, returning a `CursorPage`, like `query_page()`.
+        """
+        return self._cursor_page('scan', dict(scan_filter=scan_filter, attributes_to_get=attributes_to_get),
+                                 page_size)
+
+    def page(self, cursor):
+        """Fetch the page of Items after the one a cursor came from, as a `CursorPage`.
+
+        Raises `InvalidCursor` if the cursor wasn't made by this table.
         """
-        return self._extend_iter(
-            self.table.query(hash_key, range_key_condition=range_key_condition,
-                             attributes_to_get=attributes_to_get, request_limit=request_limit,
-                             max_results=max_results, consistent_read=consistent_read,
-                             scan_index_forward=scan_index_forward, exclusive_start_key=exclusive_start_key,
-                             item_class=Item._table_types[self.table_name]))
+        method, params, page_size, exclusive_start_key = self._read_cursor(cursor)
+        return self._cursor_page(method, params, page_size, exclusive_start_key)
 
-    def scan(self, scan_filter=None, attributes_to_get=None, request_limit=None, max_results=None, count=False,
-             exclusive_start_key=None):
-        """Scan through this table.
+    def _cursor_page(self, method, params, page_size, exclusive_start_key=None):
+        if method == 'query':
+            pages = self._query_pages(max_results=page_size, exclusive_start_key=exclusive_start_key, **params)
+        else:
+            pages = self._scan_pages(max_results=page_size, exclusive_start_key=exclusive_start_key, **params)
+        # Each page of results is a request; a filter could otherwise
+        # keep us asking for more indefinitely to fill this one.
+        pages = list(itertools.islice(pages, self.cursor_max_requests))
+        items = list(self._extend_pages(pages, params['attributes_to_get']))
+        last_evaluated_key = pages[-1].last_evaluated_key if pages else None
+        cursor = None
+        if last_evaluated_key is not None:
+            cursor = self._make_cursor(method, params, page_size, last_evaluated_key)
+        return CursorPage(items, cursor)
+
+    def _cursor_key(self):
+        if self.cursor_secret is None:
+            raise ValueError('Set `cursor_secret` on %s to use cursors.' % self.__class__.__name__)
+        secret = self.cursor_secret
+        return secret.encode('utf-8') if isinstance(secret, text_type) else secret
+
+    def _make_cursor(self, method, params, page_size, exclusive_start_key):
+        payload = json.dumps(_cursor_encode(dict(t=self.table_name, m=method, p=params, n=page_size,
+                                                 k=exclusive_start_key)),
+                             sort_keys=True, separators=(',', ':')).encode('utf-8')
+        signature = hmac.new(self._cursor_key(), payload, hashlib.sha256).digest()[:16]
+        return '%s.%s' % (_b64(payload), _b64(signature))
+
+    def _read_cursor(self, cursor):
+        try:
+            payload, signature = [_unb64(part) for part in cursor.split('.')]
+        except (ValueError, TypeError, UnicodeError):
+            raise InvalidCursor('Malformed cursor.')
+        expected = hmac.new(self._cursor_key(), payload, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(signature, expected):
+            raise InvalidCursor('Bad cursor signature.')
+        state = _cursor_decode(json.loads(payload.decode('utf-8')))
+        if state['t'] != self.table_name:
+            raise InvalidCursor('Cursor is for table `%s`.' % state['t'])
+        return state['m'], state['p'], state['n'], state['k']
+
+    def map_reduce(self, map_fn, reduce_fn, segments=None, processes=None, scan_filter=None,
+                   attributes_to_get=None, models=()):
+        """Scan this table in parallel, mapping each Item and reducing the results.
+
+        The scan is split into `segments` (one per process by default),
+        shared among `processes` worker processes (one per CPU by
+        default). Each worker reduces `map_fn(item)` over its segments,
+        and the partial results are reduced again here, in no particular
+        order, so `reduce_fn(a, b)` should be associative and
+        commutative. Returns `None` if nothing was scanned.
+
+        Workers get a copy of the backend, and import the `models`
+        modules to register Item sub-classes; `map_fn` and `reduce_fn`
+        must be picklable, i.e. module-level functions. With
+        `processes=1`, everything happens in this process. Backends
+        without parallel scans get a single segment.
+        """
+        if processes is None:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        if segments is None:
+            segments = processes
+        if not self.backend.parallel_scan and segments > 1:
+            warnings.warn('%s cannot scan in parallel; using one segment.' % self.backend.__class__.__name__)
+            segments = 1
+
+        tasks = [(map_fn, reduce_fn, segment, segments, scan_filter, attributes_to_get)
+                 for segment in range(segments)]
+        result = NONE
+        for part in _run_tasks(self.duo_db, self.table_name, _map_segment, tasks,
+                               min(processes, segments), models):
+            if part is not NONE:
+                result = part if result is NONE else reduce_fn(result, part)
+        return None if result is NONE else result
+
+
+# Cursors let a web API hand a client "the next page" without the
+# client re-running its query from the top. A cursor is the query's
+# parameters and where it got up to, as URL-safe JSON, signed so that
+# clients can't tamper with it.
+
+
+CursorPage = collections.namedtuple('CursorPage', ['items', 'cursor'])
+CursorPage.__doc__ = """A page of Items, and the cursor for the next page (None on the last page).
+"""
 
-        This is a very long and expensive operation, and should be avoided if at all possible.
 
-        Returns items using the registered subclass, if one has been registered.
+class InvalidCursor(ValueError):
+    """A cursor was malformed, tampered with, or meant for another table.
+    """
 
-        See http://boto.readthedocs.org/en/latest/ref/dynamodb.html#boto.dynamodb.table.Table.scan
+
+_CONDITION_TYPES = dict((c.__name__, c) for c in (EQ, NE, LE, LT, GE, GT, NULL, NOT_NULL, CONTAINS, NOT_CONTAINS,
+                                                  BEGINS_WITH, IN, BETWEEN))
+
+
+def _cursor_encode(value):
+    """Turn a parameter value into something JSON can carry without losing its type.
+    """
+    if isinstance(value, Binary):
+        return {'$b': base64.b64encode(value.value).decode('ascii')}
+    elif isinstance(value, decimal.Decimal):
+        return {'$d': str(value)}
+    elif isinstance(value, dict):
+        return dict((k, _cursor_encode(v)) for k, v in iteritems(value))
+    elif isinstance(value, (list, tuple)):
+        return [_cursor_encode(v) for v in value]
+    elif isinstance(value, (set, frozenset)):
+        return {'$s': [_cursor_encode(v) for v in value]}
+    elif isinstance(value, Condition) or hasattr(value, 'v1') or hasattr(value, 'values'):
+        operator, arguments = _condition_args(value)
+        return {'$c': [operator, [_cursor_encode(a) for a in arguments]]}
+    return value
+
+
+def _cursor_decode(value):
+    if isinstance(value, dict):
+        if '$b' in value:
+            return Binary(base64.b64decode(value['$b']))
+        elif '$d' in value:
+            return decimal.Decimal(value['$d'])
+        elif '$s' in value:
+            return set(_cursor_decode(v) for v in value['$s'])
+        elif '$c' in value:
+            operator, arguments = value['$c']
+            arguments = [_cursor_decode(a) for a in arguments]
+            condition_type = _CONDITION_TYPES[operator]
+            return condition_type(arguments) if condition_type is IN else condition_type(*arguments)
+        return dict((k, _cursor_decode(v)) for k, v in iteritems(value))
+    elif isinstance(value, list):
+        return [_cursor_decode(v) for v in value]
+    return value
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _unb64(text):
+    text = text.encode('ascii')
+    return base64.urlsafe_b64decode(text + b'=' * (-len(text) % 4))
+
+
+class Query(object):
+    """A query or scan, built from Field comparisons and run when iterated.
+
+    Values are converted through each field's `from_python()`, so you
+    compare against Python values, not stored ones. An equality test
+    on the hash key makes this a query, with any range key comparison
+    as its range key condition; everything else is filtered
+    server-side. Without one, it's a scan. On a table without a range
+    key, an equality test on the hash key is just a lookup.
+
+    Each method returns a new Query, leaving this one alone.
+    """
+    def __init__(self, table, conditions=(), attributes=None, max_results=None,
+                 scan_index_forward=True, consistent_read=False):
+        self.table = table
+        self.conditions = tuple(conditions)
+        self.attributes = attributes
+        self.max_results = max_results
+        self.scan_index_forward = scan_index_forward
+        self.consistent_read = consistent_read
+
+    def _clone(self, **changes):
+        params = dict(
+            conditions = self.conditions,
+            attributes = self.attributes,
+            max_results = self.max_results,
+            scan_index_forward = self.scan_index_forward,
+            consistent_read = self.consistent_read,
+        )
+        params.update(changes)
+        return self.__class__(self.table, **params)
+
+    def filter(self, *conditions):
+        """Narrow the results by more FieldConditions.
+        """
+        return self._clone(conditions=self.conditions + conditions)
+
+    def only(self, *fields):
+        """Fetch only these attributes (Fields or names), plus the item's keys.
+        """
+        names = [getattr(f, 'name', f) for f in fields]
+        for name in (self.table.hash_key_name, self.table.range_key_name):
+            if name is not None and name not in names:
+                names.append(name)
+        return self._clone(attributes=names)
+
+    def limit(self, max_results):
+        return self._clone(max_results=max_results)
+
+    def reverse(self):
+        """Return query results in descending range key order.
+        """
+        return self._clone(scan_index_forward=not self.scan_index_forward)
+
+    def consistent(self):
+        """Use strongly consistent reads (queries only).
+        """
+        return self._clone(consistent_read=True)
+
+    def _conditions_by_name(self):
+        by_name = collections.OrderedDict()
+        for field_condition in self.conditions:
+            by_name.setdefault(field_condition.name, []).append(field_condition.condition)
+
+        for name, conditions in iteritems(by_name):
+            if len(conditions) == 1:
+                by_name[name] = conditions[0]
+                continue
+            # DynamoDB takes one condition per attribute. A pair of
+            # inclusive bounds is the one combination we can express.
+            bounds = dict(_condition_args(c) for c in conditions)
+            if len(conditions) == 2 and set(bounds) == set(['GE', 'LE']):
+                by_name[name] = BETWEEN(bounds['GE'][0], bounds['LE'][0])
+            else:
+                raise ValueError('Cannot combine %s conditions on `%s`.'
+                                 % (', '.join(sorted(bounds)), name))
+        return by_name
+
+    def compile(self):
+        """Work out the table method and arguments this Query boils down to.
+
+        Returns `('query', kwargs)`, `('scan', kwargs)` or, on hash-only
+        tables, `('get_item', kwargs)`, whose `query_filter` is for the
+        caller to apply.
+        """
+        conditions = self._conditions_by_name()
+        hash_condition = conditions.get(self.table.hash_key_name)
+        if hash_condition is not None and _condition_args(hash_condition)[0] == 'EQ':
+            del conditions[self.table.hash_key_name]
+            if self.table.range_key_name is None:
+                attributes = self.attributes
+                if attributes is not None:
+                    attributes = attributes + [name for name in conditions if name not in attributes]
+                kwargs = dict(
+                    hash_key = _condition_args(hash_condition)[1][0],
+                    query_filter = conditions or None,
+                    attributes_to_get = attributes,
+                    consistent_read = self.consistent_read,
+                )
+                return 'get_item', kwargs
+            kwargs = dict(
+                hash_key = _condition_args(hash_condition)[1][0],
+                range_key_condition = conditions.pop(self.table.range_key_name, None),
+                query_filter = conditions or None,
+                attributes_to_get = self.attributes,
+                max_results = self.max_results,
+                scan_index_forward = self.scan_index_forward,
+                consistent_read = self.consistent_read,
+            )
+            return 'query', kwargs
+        else:
+            kwargs = dict(
+                scan_filter = conditions or None,
+                attributes_to_get = self.attributes,
+                max_results = self.max_results,
+            )
+            return 'scan', kwargs
+
+    def __iter__(self):
+        method, kwargs = self.compile()
+        if method == 'get_item':
+            return iter(self._get_item(**kwargs))
+        return iter(getattr(self.table, method)(**kwargs))
+
+    def _get_item(self, query_filter=None, **kwargs):
+        """Look up the one item a Query on a hash-only table can match, in a list.
+        """
+        if self.max_results == 0:
+            return []
+        try:
+            item = self.table.get_item(**kwargs)
+        except ItemNotFound:
+            return []
+        if not all(_condition_matches(c, item, name) for name, c in iteritems(query_filter or {})):
+            return []
+        return [item]
+
+    def page(self, page_size):
+        """Fetch the first page of results as a `CursorPage`; see `Table.page()` for the rest.
+        """
+        method, kwargs = self.compile()
+        if method == 'get_item':
+            return CursorPage(self._get_item(**kwargs), None)
+        kwargs.pop('max_results')
+        if method == 'scan':
+            return self.table.scan_page(page_size, **kwargs)
+        return self.table.query_page(kwargs.pop('hash_key'), page_size, **kwargs)
+
+
+def _shard_key(hash_key, shard):
+    """The hash key of one shard of a sharded hash key: `'<hash_key>#<shard>'`.
+    """
+    return '%s#%s' % (hash_key, shard)
+
+
+class _Prefetch(object):
+    """Iterate over whatever `func()` returns in a background thread, up to `size` items ahead.
+
+    The thread starts straight away. Exceptions come out of `next()`;
+    `close()` stops the thread early.
+    """
+    _done = object()
+
+    def __init__(self, func, size=100):
+        self._results = queue.Queue(size)
+        self._stop = threading.Event()
+        thread = threading.Thread(target=self._run, args=(func,))
+        thread.daemon = True
+        thread.start()
+
+    def _put(self, entry):
+        while not self._stop.is_set():
+            try:
+                self._results.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, func):
+        try:
+            for value in func():
+                if not self._put((value, None)):
+                    return
+        except Exception:
+            self._put((self._done, sys.exc_info()))
+        else:
+            self._put((self._done, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._stop.is_set():
+            raise StopIteration()
+        value, exc_info = self._results.get()
+        if value is self._done:
+            self.close()
+            if exc_info is not None:
+                reraise(*exc_info)
+            raise StopIteration()
+        return value
+    next = __next__
+
+    def close(self):
+        self._stop.set()
+
+
+@total_ordering
+class _Descending(object):
+    """Sort a value the other way round.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _merge_sorted(iterables, key, reverse=False):
+    """Merge already-sorted iterables into one sorted stream, like `heapq.merge()` with a `key`.
+    """
+    sort_key = (lambda value: _Descending(key(value))) if reverse else key
+    heap = []
+    for index, iterable in enumerate(iterables):
+        iterator = iter(iterable)
+        for value in iterator:
+            heap.append((sort_key(value), index, value, iterator))
+            break
+    heapq.heapify(heap)
+    while heap:
+        _, index, value, iterator = heap[0]
+        yield value
+        for value in iterator:
+            heapq.heapreplace(heap, (sort_key(value), index, value, iterator))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+class CounterAggregator(object):
+    """Sum counter increments in memory, and write them out periodically.
+
+    Rather than one write per increment, each key gets one `ADD` per
+    flush, for all its counters. Flushes happen on `increment()` once
+    `flush_interval` seconds have passed, on `flush()` and `close()`,
+    and, with `background=True`, from a daemon thread::
+
+        with duo.CounterAggregator(db['page_views'], flush_interval=5) as views:
+            views.increment('home', 'count')
+
+    For counters too hot for one item, set `shards`: each flush then
+    adds to one of that many items, whose hash keys are the counter's
+    with a `#<shard>` suffix, chosen at random. `read()` adds them up.
+    Sharded counters need string hash keys.
+
+    Unflushed increments are lost if the process dies; failed flushes
+    keep their increments for next time.
+    """
+    def __init__(self, table, flush_interval=1.0, shards=None, background=False):
+        if shards:
+            field = getattr(table.item_class, table.hash_key_name, None)
+            if isinstance(field, Field) and not isinstance(field, UnicodeField):
+                raise ValueError('%s has a %s hash key; sharded counters need string hash keys.'
+                                 % (table.table_name, field.__class__.__name__))
+        self.table = table
+        self.flush_interval = flush_interval
+        self.shards = shards
+        self._pending = collections.defaultdict(lambda: collections.defaultdict(int))
+        self._lock = threading.Lock()
+        self._flushed_at = time.time()
+        self._thread = None
+        if background:
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                warnings.warn('Counter flush failed. %s: %s' % (e.__class__.__name__, e))
+
+    @staticmethod
+    def _split_key(key):
+        return key if isinstance(key, tuple) else (key, None)
+
+    def increment(self, key, name, n=1):
+        """Add `n` to counter `name` on the item with `key`, sooner or later.
+
+        `key` is a hash key, or a `(hash_key, range_key)` tuple.
+        """
+        key = self._split_key(key)
+        if self.shards and not isinstance(key[0], string_types):
+            raise ValueError('Sharded counters need string hash keys, not %r.' % (key[0],))
+        with self._lock:
+            self._pending[key][name] += n
+        if self._thread is None and time.time() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write out every pending increment.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, collections.defaultdict(lambda: collections.defaultdict(int))
+            self._flushed_at = time.time()
+
+        table = self.table
+        pending = list(pending.items())
+        while pending:
+            (hash_key, range_key), counts = pending[-1]
+            if not any(counts.values()):
+                pending.pop()
+                continue
+            if self.shards:
+                hash_key = _shard_key(hash_key, random.randrange(self.shards))
+            try:
+                table.backend.update_item(table.table, hash_key, range_key,
+                                          dict((name, ('ADD', n)) for name, n in iteritems(counts) if n))
+            except Exception:
+                # Put back what we didn't write.
+                with self._lock:
+                    for key, counts in pending:
+                        for name, n in iteritems(counts):
+                            self._pending[key][name] += n
+                raise
+            pending.pop()
+            try:
+                if table.cache is not None:
+                    table.cache.delete(table._get_cache_key(hash_key, range_key))
+                table._bump_query_generation(hash_key)
+            except Exception as e:
+                warnings.warn('Cache invalidation failed on counter flush. %s: %s' % (e.__class__.__name__, e))
+
+    def read(self, key, name):
+        """Read a counter's total from DynamoDB, across its shards, plus anything pending.
+        """
+        hash_key, range_key = self._split_key(key)
+        table = self.table
+        if self.shards:
+            keys = [(_shard_key(hash_key, shard), range_key) for shard in range(self.shards)]
+            found = table.backend.batch_get(table.table, keys, attributes_to_get=[name])
+        else:
+            try:
+                found = [table.backend.get_item(table.table, hash_key, range_key, attributes_to_get=[name])]
+            except ItemNotFound:
+                found = []
+        with self._lock:
+            pending = self._pending.get((hash_key, range_key), {}).get(name, 0)
+        return sum(attrs.get(name, 0) for attrs in found) + pending
+
+    def close(self):
+        """Stop the background thread, if any, and flush.
         """
-        return self._extend_iter(
-            self.table.scan(scan_filter=scan_filter, attributes_to_get=attributes_to_get, request_limit=request_limit,
-                            max_results=max_results, count=count, exclusive_start_key=exclusive_start_key,
-                            item_class=Item._table_types[self.table_name]))
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FieldCondition(object):
+    """A condition on the attribute behind a Field, from comparing the Field itself.
+
+    `MyItem.count >= 3` builds one of these.
+    """
+    def __init__(self, name, condition):
+        self.name = name
+        self.condition = condition
+
+    def __repr__(self):
+        return '<%s %s %r>' % (self.__class__.__name__, self.name, self.condition)
 
 
 class NONE(object): pass
@@ -570,8 +3208,18 @@ class NONE(object): pass
 
 class Field(object):
     """A Field acts as a data descriptor on Item subclasses.
+
+    Decoded values are memoized on the item, so repeated reads of the
+    same attribute only pay for `to_python()` once. Set `memoize =
+    False` on fields whose conversion is cheaper than the bookkeeping.
+
+    Comparing a Field on the Item class builds a FieldCondition, for
+    `Table.filter()`, not a bool. A FieldCondition is always truthy,
+    so `'foo' in [MyItem.foo]` is True: test membership of Fields by
+    identity, or against other Fields.
     """
     name = None
+    memoize = True
 
     def __init__(self, default=NONE, readonly=False):
         self.default = default
@@ -584,9 +3232,26 @@ class Field(object):
     def from_python(self, obj, value):
         raise NotImplementedError()
 
+    def _ensure_named(self, cls):
+        if self.name is None and hasattr(cls, '_name_fields'):
+            cls._name_fields()
+
     def __get__(self, obj, type=None):
+        if self.name is None:
+            self._ensure_named(type or obj.__class__)
+        if obj is None:
+            return self
+
+        if self.memoize:
+            try:
+                return obj._decoded[self.name]
+            except KeyError:
+                pass
+
         try:
             value = self.to_python(obj, obj[self.name])
+            if self.memoize:
+                obj._decoded[self.name] = value
         except KeyError:
             if self.default is not NONE:
                 if callable(self.default) and not isinstance(self.default, EnumMeta):
@@ -603,6 +3268,8 @@ class Field(object):
         return value
 
     def __set__(self, obj, value):
+        if self.name is None:
+            self._ensure_named(obj.__class__)
         if self.name == getattr(obj, 'hash_key_name'):
             raise AttributeError('Cannot set hash key `%s`!' % self.name)
         elif self.name == getattr(obj, 'range_key_name'):
@@ -617,7 +3284,68 @@ class Field(object):
             else:
                 obj[self.name] = self.from_python(obj, value)
 
+    # Comparing a Field (on the Item class) builds a FieldCondition for
+    # `Table.filter()`, with the other side converted for storage.
+    # Comparing two Fields is left to Python, so Fields still work in
+    # lists, sets and dicts.
+
+    __hash__ = object.__hash__
+
+    def _compare(self, condition_type, *values):
+        return FieldCondition(self.name, condition_type(*[self.from_python(None, v) for v in values]))
+
+    def _operator(self, condition_type, other):
+        if isinstance(other, Field):
+            return NotImplemented
+        if other is None:
+            # Converted, None would become some stored value ('None',
+            # 0...), and match the wrong items.
+            if condition_type is EQ:
+                return FieldCondition(self.name, NULL())
+            elif condition_type is NE:
+                return FieldCondition(self.name, NOT_NULL())
+            raise TypeError('Cannot compare `%s` with None by %s.' % (self.name, condition_type.__name__))
+        return self._compare(condition_type, other)
+
+    def __eq__(self, other):
+        return self._operator(EQ, other)
+
+    def __ne__(self, other):
+        return self._operator(NE, other)
+
+    def __lt__(self, other):
+        return self._operator(LT, other)
+
+    def __le__(self, other):
+        return self._operator(LE, other)
+
+    def __gt__(self, other):
+        return self._operator(GT, other)
+
+    def __ge__(self, other):
+        return self._operator(GE, other)
+
+    def between(self, low, high):
+        return self._compare(BETWEEN, low, high)
+
+    def is_in(self, values):
+        return FieldCondition(self.name, IN([self.from_python(None, v) for v in values]))
+
+    def begins_with(self, prefix):
+        return FieldCondition(self.name, BEGINS_WITH(prefix))
+
+    def contains(self, value):
+        return FieldCondition(self.name, CONTAINS(value))
+
+    def exists(self):
+        return FieldCondition(self.name, NOT_NULL())
+
+    def does_not_exist(self):
+        return FieldCondition(self.name, NULL())
+
     def __delete__(self, obj):
+        if self.name is None:
+            self._ensure_named(obj.__class__)
         if self.name == getattr(obj, 'hash_key_name'):
             raise AttributeError('Cannot delete hash key `%s`!' % self.name)
         elif self.name == getattr(obj, 'range_key_name'):
@@ -631,6 +3359,8 @@ class Field(object):
 class UnicodeField(Field):
     """Store a simple unicode string as a native DynamoDB string.
     """
+    memoize = False
+
     def to_python(self, obj, value):
         return value
 
@@ -641,6 +3371,8 @@ class UnicodeField(Field):
 class IntegerField(Field):
     """Store a simple integer as a native DynamoDB integer.
     """
+    memoize = False
+
     def to_python(self, obj, value):
         return value
 
@@ -651,9 +3383,25 @@ class IntegerField(Field):
 IntField = IntegerField
 
 
+class VersionField(IntegerField):
+    """Count an item's writes, for optimistic locking.
+
+    `put()` and `save()` move the version on by one and, unless given
+    other expected values, make the version they read the write's only
+    condition, raising VersionConflict if someone else got there
+    first. Use `Table.retry_on_conflict()` to reread and try again.
+    """
+    def __init__(self, readonly=True):
+        super(VersionField, self).__init__(readonly=readonly)
+
+
 class _ChoiceMixin(Field):
     """A field mixin that enforces a set of possible values, using an Enum.
     """
+    # Ahead of UnicodeField and IntField in the MRO, this overrides their
+    # `memoize = False`: looking up an Enum member isn't free.
+    memoize = True
+
     def __init__(self, **kwargs):
         self.enum_type = kwargs.pop('enum_type')
         super(_ChoiceMixin, self).__init__(**kwargs)
@@ -676,6 +3424,79 @@ class EnumField(_ChoiceMixin, IntField):
         return int(self.enum_type[value])
 
 
+class EnumSetField(IntField):
+    """An integer field that stores a set of Enum members as a bitmask.
+
+    Reading the field returns an `EnumSet`; a missing attribute reads
+    as the empty set. Any collection of members (or an `EnumSet`, or a
+    raw bitmask) can be assigned.
+
+    DynamoDB has no bitwise comparisons, so the `scan_filter_*()`
+    helpers enumerate every stored value that would match and filter
+    with `IN`. That's only practical for small enums, so they refuse
+    to build filters longer than `max_filter_values`.
+    """
+    memoize = True
+    max_filter_values = 100
+
+    def __init__(self, **kwargs):
+        self.enum_type = kwargs.pop('enum_type')
+        kwargs.setdefault('default', 0)
+        super(EnumSetField, self).__init__(**kwargs)
+
+    def to_python(self, obj, value):
+        return EnumSet(self.enum_type, int(value))
+
+    def from_python(self, obj, value):
+        return EnumSet(self.enum_type, value).mask
+
+    def _filter_masks(self, masks, count):
+        if count > self.max_filter_values:
+            raise ValueError('Filter on `%s` would need %s values; the limit is %s.'
+                             % (self.name, count, self.max_filter_values))
+        return {self.name: IN(list(masks))}
+
+    def scan_filter_equals(self, members):
+        """Build a scan filter matching items whose set is exactly `members`.
+        """
+        return {self.name: EQ(EnumSet(self.enum_type, members).mask)}
+
+    def scan_filter_all(self, *members):
+        """Build a scan filter matching items whose set contains all of `members`.
+        """
+        required = EnumSet(self.enum_type, members).mask
+        free = ((1 << len(self.enum_type)) - 1) & ~required
+
+        def masks():
+            # Walk every subset of the free bits.
+            subset = free
+            while True:
+                yield required | subset
+                if subset == 0:
+                    break
+                subset = (subset - 1) & free
+
+        return self._filter_masks(masks(), 2 ** bin(free).count('1'))
+
+    def scan_filter_any(self, *members):
+        """Build a scan filter matching items whose set contains any of `members`.
+        """
+        wanted = EnumSet(self.enum_type, members).mask
+        size = len(self.enum_type)
+        count = 2 ** size - 2 ** (size - bin(wanted).count('1'))
+        return self._filter_masks((m for m in range(1, 2 ** size) if m & wanted), count)
+
+    def has_all(self, *members):
+        """Like `scan_filter_all()`, as a FieldCondition for `Table.filter()`.
+        """
+        return FieldCondition(self.name, self.scan_filter_all(*members)[self.name])
+
+    def has_any(self, *members):
+        """Like `scan_filter_any()`, as a FieldCondition for `Table.filter()`.
+        """
+        return FieldCondition(self.name, self.scan_filter_any(*members)[self.name])
+
+
 class DateField(Field):
     """An integer field that stores `datetime.date` objects as ordinal integers.
     """
@@ -737,3 +3558,659 @@ class ForeignKeyField(Field):
             'table': value.table_name,
             'key': value.dynamo_key
         })
+
+
+def _default_json():
+    """Find the fastest JSON library available, falling back on `json`.
+    """
+    global _json_module
+    if _json_module is None:
+        try:
+            import ujson as module
+        except ImportError:
+            module = json
+        _json_module = module
+    return _json_module
+
+_json_module = None
+
+
+class JSONField(Field):
+    """A unicode field that stores any JSON-serializable value.
+
+    Uses `ujson` when it's installed, or pass `json_module` to choose
+    another library with `dumps()` and `loads()`. Decoded values are
+    memoized on the item, so mutating one in place won't be saved:
+    assign the value back to the field after changing it.
+    """
+    def __init__(self, **kwargs):
+        self.json_module = kwargs.pop('json_module', None)
+        super(JSONField, self).__init__(**kwargs)
+
+    def to_python(self, obj, value):
+        if not isinstance(value, (string_types, bytes)):
+            # A default, not yet encoded.
+            return value
+        return (self.json_module or _default_json()).loads(value)
+
+    def from_python(self, obj, value):
+        value = (self.json_module or _default_json()).dumps(value)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+
+def _compress(codec, data, level=None):
+    """Compress `data`, prefixed with a byte naming the codec.
+    """
+    if codec == 'zlib':
+        return b'z' + zlib.compress(data, 6 if level is None else level)
+    elif codec == 'zstd':
+        import zstandard
+        return b's' + zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    raise ValueError('Unknown compression codec %r.' % codec)
+
+
+def _decompress(data):
+    """Decompress the output of `_compress()`, whichever codec made it.
+    """
+    header, data = data[:1], data[1:]
+    if header == b'z':
+        return zlib.decompress(data)
+    elif header == b's':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError('Unknown compression header %r.' % header)
+
+
+class _CompressionMixin(Field):
+    """A field mixin that compresses large values into binary attributes.
+
+    Values that encode to at least `threshold` bytes are compressed
+    with `codec` ('zlib', or 'zstd' if `zstandard` is installed) and
+    stored as `Binary`; smaller values, and values that don't shrink,
+    are stored as plain strings. Either codec can read the other's
+    values, so it's safe to switch.
+    """
+    memoize = True
+
+    def __init__(self, **kwargs):
+        self.threshold = kwargs.pop('threshold', 1024)
+        self.codec = kwargs.pop('codec', 'zlib')
+        self.level = kwargs.pop('level', None)
+        super(_CompressionMixin, self).__init__(**kwargs)
+
+    def to_python(self, obj, value):
+        if isinstance(value, Binary):
+            value = _decompress(value.value).decode('utf-8')
+        return super(_CompressionMixin, self).to_python(obj, value)
+
+    def from_python(self, obj, value):
+        value = super(_CompressionMixin, self).from_python(obj, value)
+        data = value.encode('utf-8')
+        if len(data) < self.threshold:
+            return value
+        compressed = _compress(self.codec, data, self.level)
+        if len(compressed) >= len(data):
+            return value
+        return Binary(compressed)
+
+
+class CompressedField(_CompressionMixin, UnicodeField):
+    """A unicode field that compresses large values into binary attributes.
+    """
+
+
+class CompressedJSONField(_CompressionMixin, JSONField):
+    """A JSON field that compresses large values into binary attributes.
+    """
+
+
+# A Mirror keeps a local copy of a read-mostly table, so lookups don't
+# have to leave the host at all.
+
+
+def _mirror_key(value):
+    """Adapt a key value for SQLite, which knows nothing of Decimals or Binary.
+    """
+    if value is None:
+        return ''
+    elif isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    elif isinstance(value, Binary):
+        import sqlite3
+        return sqlite3.Binary(value.value)
+    return value
+
+
+class Mirror(object):
+    """A local copy of a table, in a SQLite file shared by every process on a host.
+
+    Set one on a Table sub-class, and `table[key]` is served from the
+    mirror, which refreshes itself whenever it's more than
+    `max_staleness` seconds old::
+
+        class CatalogTable(duo.Table):
+            table_name = 'catalog'
+            mirror = duo.Mirror('/var/tmp/catalog.db', updated_field='updated_at')
+
+    With an `updated_field` (say, a `DateTimeField` your Items keep
+    current), a refresh only fetches items updated since the last one,
+    less `overlap` seconds for clock skew. DynamoDB still reads the
+    whole table to filter the scan, so this saves transfer and
+    processing rather than read capacity. Incremental refreshes can't
+    see deletions, so the mirror is rebuilt from a full scan every
+    `full_refresh_interval` seconds; deletes through duo on this host
+    apply straight away, as do puts, saves and increments.
+    `Table.get_item()`, `query()` and `scan()` still go to DynamoDB.
+
+    Only one process refreshes at a time; the rest carry on reading
+    the previous copy, rather than waiting. Items are stored as JSON,
+    so a mirror file is only data, whoever can write to it.
+    """
+    format = 'json'
+
+    def __init__(self, path, updated_field=None, max_staleness=60, full_refresh_interval=3600, overlap=5,
+                 request_limit=None, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self.updated_field = updated_field
+        self.max_staleness = max_staleness
+        self.full_refresh_interval = full_refresh_interval
+        self.overlap = overlap
+        self.request_limit = request_limit
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """A SQLite connection for this thread, in this process.
+        """
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS items ('
+                               'hash_key, range_key, attrs TEXT, PRIMARY KEY (hash_key, range_key))')
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)')
+            if self._meta(connection).get('format') != self.format:
+                # Written some other way (or not at all): start again.
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute('DELETE FROM items')
+                connection.execute('DELETE FROM meta')
+                connection.execute("INSERT INTO meta (name, value) VALUES ('format', ?)", (self.format,))
+                connection.execute('COMMIT')
+            local.connection = connection
+            local.pid = os.getpid()
+            local.fresh_until = 0
+        return local.connection
+
+    def _meta(self, connection):
+        return dict(connection.execute('SELECT name, value FROM meta'))
+
+    def get(self, hash_key, range_key=None):
+        """Find an item's attributes, or None.
+        """
+        row = self.connection.execute('SELECT attrs FROM items WHERE hash_key = ? AND range_key = ?',
+                                      (_mirror_key(hash_key), _mirror_key(range_key))).fetchone()
+        return _cursor_decode(json.loads(row[0])) if row is not None else None
+
+    def query(self, hash_key):
+        """Find the attributes of every item with a hash key, in range key order.
+        """
+        rows = self.connection.execute('SELECT attrs FROM items WHERE hash_key = ? ORDER BY range_key',
+                                       (_mirror_key(hash_key),))
+        return [_cursor_decode(json.loads(attrs)) for attrs, in rows]
+
+    def store(self, table, attrs, connection=None):
+        """Store an item's attributes.
+        """
+        (connection or self.connection).execute(
+            'INSERT OR REPLACE INTO items (hash_key, range_key, attrs) VALUES (?, ?, ?)',
+            (_mirror_key(attrs.get(table.hash_key_name)),
+             _mirror_key(attrs.get(table.range_key_name) if table.range_key_name else None),
+             json.dumps(_cursor_encode(dict(attrs)))))
+
+    def discard(self, hash_key, range_key=None):
+        """Remove an item.
+        """
+        self.connection.execute('DELETE FROM items WHERE hash_key = ? AND range_key = ?',
+                                (_mirror_key(hash_key), _mirror_key(range_key)))
+
+    def ensure_fresh(self, table):
+        """Refresh the mirror if it's more than `max_staleness` seconds old.
+
+        Returns whether the mirror can serve lookups: False if it's
+        never been filled, say because another process is still doing
+        the first scan, when a miss wouldn't mean the item is missing.
+        """
+        if time.time() < getattr(self._local, 'fresh_until', 0):
+            return True
+        refreshed_at = self._meta(self.connection).get('refreshed_at')
+        if refreshed_at is not None and time.time() < refreshed_at + self.max_staleness:
+            self._local.fresh_until = refreshed_at + self.max_staleness
+            return True
+        self.refresh(table, wait=False)
+        if refreshed_at is None and self._meta(self.connection).get('refreshed_at') is None:
+            # Don't take the empty mirror for a fresh one next time.
+            self._local.fresh_until = 0
+            return False
+        return True
+
+    def _lock(self, connection, wait):
+        """Take the write lock, or, unless told to `wait`, give up if another process has it.
+        """
+        if wait:
+            connection.execute('BEGIN IMMEDIATE')
+            return True
+        import sqlite3
+        connection.execute('PRAGMA busy_timeout = 0')
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            connection.execute('PRAGMA busy_timeout = %d' % (self.timeout * 1000))
+        return True
+
+    def refresh(self, table, full=False, force=False, wait=True):
+        """Bring the mirror up to date from a scan of the table.
+
+        Unless `force`d, a refresh is skipped if another process got
+        there first. Unless told to `wait`, it's also skipped while
+        another process is refreshing, and the copy we have will do
+        for now. Returns the number of items fetched.
+        """
+        connection = self.connection
+        # Take the write lock up front, so only one process scans.
+        if not self._lock(connection, wait):
+            # Check back in a second.
+            self._local.fresh_until = time.time() + min(1, self.max_staleness)
+            return 0
+        try:
+            meta = self._meta(connection)
+            started = time.time()
+            if not force and meta.get('refreshed_at', 0) + self.max_staleness > started:
+                connection.execute('COMMIT')
+                self._local.fresh_until = meta['refreshed_at'] + self.max_staleness
+                return 0
+
+            checkpoint = meta.get('checkpoint')
+            full = (full or self.updated_field is None or checkpoint is None
+                    or meta.get('full_refreshed_at', 0) + self.full_refresh_interval <= started)
+            if full:
+                connection.execute('DELETE FROM items')
+                scan_filter = None
+            else:
+                scan_filter = {self.updated_field: GE(checkpoint - self.overlap)}
+
+            fetched = 0
+            for page in table.backend.scan(table.table, scan_filter=scan_filter,
+                                           request_limit=self.request_limit):
+                for attrs in page.items:
+                    self.store(table, attrs, connection)
+                    updated = attrs.get(self.updated_field) if self.updated_field else None
+                    if updated is not None and (checkpoint is None or updated > checkpoint):
+                        checkpoint = float(updated)
+                fetched += len(page.items)
+
+            updates = [('refreshed_at', started), ('checkpoint', checkpoint)]
+            if full:
+                updates.append(('full_refreshed_at', started))
+            connection.executemany('INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)', updates)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._local.fresh_until = started + self.max_staleness
+        return fetched
+
+
+# Finally, work spread across processes: `Table.map_reduce()`, and
+# bulk loading. `python -m duo load` spreads an input file across a
+# pool of processes, each of which builds Items through the registered
+# Item sub-class and writes them in batches. See `main()`.
+
+
+class LoadStats(object):
+    """Counts from a bulk load, combinable across workers with `+`.
+    """
+    def __init__(self, rows=0, items=0, batches=0, retries=0, seconds=0.0):
+        self.rows = rows
+        self.items = items
+        self.batches = batches
+        self.retries = retries
+        self.seconds = seconds
+
+    def __add__(self, other):
+        return LoadStats(self.rows + other.rows, self.items + other.items,
+                         self.batches + other.batches, self.retries + other.retries,
+                         max(self.seconds, other.seconds))
+
+    @property
+    def rate(self):
+        """Items written per second.
+        """
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return ('%s(rows=%s, items=%s, batches=%s, retries=%s, seconds=%.2f)'
+                % (self.__class__.__name__, self.rows, self.items, self.batches, self.retries, self.seconds))
+
+
+class _Loader(object):
+    """Build Items from rows, and write them in batches.
+    """
+    def __init__(self, table, batch_size=25, max_retries=8, track_keys=False):
+        self.table = table
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.item_class = table.item_class
+        self.backend = table.duo_db.backend
+        # The `(hash_key, range_key)` of every Item written, if asked for.
+        self.keys = set() if track_keys else None
+        self._fields = {}
+
+    def field(self, name):
+        """Find the Field for an attribute, if the Item sub-class declares one.
+        """
+        try:
+            return self._fields[name]
+        except KeyError:
+            field = getattr(self.item_class, name, None)
+            field = self._fields[name] = field if isinstance(field, Field) else None
+            return field
+
+    def key(self, row, name):
+        value = row.pop(name, None) if name else None
+        field = self.field(name) if name else None
+        if value is not None and field is not None:
+            value = field.from_python(None, value)
+        return value
+
+    def build(self, row):
+        """Build an Item from a dict of attributes, converting through its Fields.
+        """
+        hash_key = self.key(row, self.table.hash_key_name)
+        range_key = self.key(row, self.table.range_key_name)
+        item = self.table.create(hash_key, range_key)
+        for name, value in iteritems(row):
+            if value is None or value == '':
+                # DynamoDB can't store empty values.
+                continue
+            if self.field(name) is not None:
+                setattr(item, name, value)
+            else:
+                item[name] = value
+        return item
+
+    def write(self, items, stats):
+        """Batch-write items, retrying unprocessed ones with jittered backoff.
+        """
+        # A batch can't mention the same key twice; the last row wins.
+        puts = collections.OrderedDict(((item._stored_hash_key, item.range_key), dict(item)) for item in items)
+        if self.keys is not None:
+            self.keys.update(puts)
+        puts = list(puts.values())
+        stats.items += len(puts)
+        attempt = 0
+        while puts:
+            stats.batches += 1
+            puts, deletes = self.backend.batch_write(self.table.table, puts=puts)
+            if not puts:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                raise RuntimeError('Gave up on %s unprocessed items after %s retries.'
+                                   % (len(puts), self.max_retries))
+            stats.retries += 1
+            time.sleep(random.uniform(0, min(5.0, 0.05 * 2 ** attempt)))
+
+    def load(self, rows):
+        stats = LoadStats()
+        batch = []
+        for row in rows:
+            stats.rows += 1
+            batch.append(self.build(row))
+            if len(batch) >= self.batch_size:
+                self.write(batch, stats)
+                batch = []
+        if batch:
+            self.write(batch, stats)
+        return stats
+
+
+def _guess_format(path):
+    if path.endswith('.csv'):
+        return 'csv'
+    elif path.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    raise ValueError('Cannot guess the format of `%s`; specify csv or ndjson.' % path)
+
+
+def _read_header(path):
+    """Read a CSV file's column names, and the offset where its rows start.
+    """
+    with open(path, 'rb') as f:
+        line = f.readline()
+        return next(_parse_csv([line])), f.tell()
+
+
+def _parse_csv(lines):
+    """Generate the rows of CSV `lines`, parsing them only as they're asked for.
+    """
+    import csv
+    if sys.version_info[0] == 2:
+        return ([cell.decode('utf-8') for cell in row] for row in csv.reader(lines))
+    return csv.reader(line.decode('utf-8') for line in lines)
+
+
+def _partition(start, end, count):
+    """Split the byte range `[start, end)` into `count` contiguous ranges.
+    """
+    step = max(1, -(-(end - start) // count))
+    return [(lo, min(lo + step, end)) for lo in range(start, end, step)]
+
+
+def _read_range(path, start, end, data_start=0):
+    """Read the lines that start within `[start, end)`.
+
+    Each range skips the line it lands in the middle of, which belongs
+    to the range before, so every line is read exactly once.
+    """
+    with open(path, 'rb') as f:
+        if start > data_start:
+            f.seek(start - 1)
+            f.readline()
+        else:
+            f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield line
+
+
+def _rows(path, format, start, end, header=None, data_start=0):
+    lines = _read_range(path, start, end, data_start)
+    if format == 'csv':
+        return (dict(zip(header, values)) for values in _parse_csv(lines))
+    elif format == 'ndjson':
+        loads = _default_json().loads
+        return (loads(line.decode('utf-8')) for line in lines)
+    raise ValueError('Unknown input format %r.' % format)
+
+
+_worker_state = {}
+
+
+def _worker_init(backend, table_name, models):
+    """Set up a worker process with its own connection to a table.
+    """
+    import importlib
+    for module in models:
+        importlib.import_module(module)
+    _worker_state['table'] = DynamoDB(backend=backend)[table_name]
+
+
+def _worker_run(args):
+    func, task = args
+    return func(_worker_state['table'], task)
+
+
+def _run_tasks(db, table_name, func, tasks, processes, models=()):
+    """Generate `func(table, task)` for each task, in any order.
+
+    Tasks run in a pool of `processes` worker processes, each with a
+    copy of `db`'s backend, having imported the `models` modules to
+    register Item sub-classes. With one process, they run right here.
+    """
+    if processes == 1:
+        table = db[table_name]
+        for task in tasks:
+            yield func(table, task)
+        return
+
+    import multiprocessing
+    pool = multiprocessing.Pool(processes, _worker_init, (db.backend, table_name, list(models)))
+    try:
+        for result in pool.imap_unordered(_worker_run, [(func, task) for task in tasks]):
+            yield result
+    except BaseException:
+        # Don't wait for the rest of the tasks to finish before failing.
+        pool.terminate()
+        pool.join()
+        raise
+    pool.close()
+    pool.join()
+
+
+def _load_range(table, task):
+    path, format, start, end, header, data_start, batch_size, max_retries, track_keys = task
+    loader = _Loader(table, batch_size, max_retries, track_keys)
+    return loader.load(_rows(path, format, start, end, header, data_start)), loader.keys or ()
+
+
+def _invalidate_loaded(table, keys):
+    """Invalidate a table's cached items and queries after a bulk load.
+
+    A table with `versioned_cache_keys` moves on to a new namespace in
+    one go; otherwise, each loaded item's cache entry goes, and each
+    loaded hash key moves on to a new query generation.
+    """
+    if table.cache is None:
+        return
+    if table.versioned_cache_keys:
+        table.invalidate_cache()
+        return
+    namespace = table._cache_namespace()
+    for hash_key, range_key in keys:
+        table.cache.delete(table._get_cache_key(hash_key, range_key, namespace))
+    for hash_key in set(hash_key for hash_key, _ in keys):
+        table._bump_query_generation(hash_key)
+
+
+def _map_segment(table, task):
+    map_fn, reduce_fn, segment, total_segments, scan_filter, attributes_to_get = task
+    result = NONE
+    for item in table.scan(scan_filter, attributes_to_get, segment=segment, total_segments=total_segments):
+        value = map_fn(item)
+        result = value if result is NONE else reduce_fn(result, value)
+    return result
+
+
+def load(db, table_name, path, format=None, processes=None, batch_size=25, max_retries=8, models=()):
+    """Bulk-load a CSV or newline-delimited JSON file into a table.
+
+    The file is split into byte ranges shared out among `processes`
+    worker processes (one per CPU by default). Each row becomes an Item
+    of the table's registered sub-class, built through its Fields, and
+    workers write `batch_size` Items at a time, retrying unprocessed
+    items up to `max_retries` times. Workers import the `models`
+    modules to register Item sub-classes, and get a copy of `db`'s
+    backend; with `processes=1`, or a MemoryBackend, everything
+    happens in this process.
+
+    CSV files need a header row, and their quoted values can't span
+    lines. Once the load finishes, cached copies of the table's items
+    and queries are invalidated. Returns the combined `LoadStats`.
+    """
+    format = format or _guess_format(path)
+    header, data_start = _read_header(path) if format == 'csv' else (None, 0)
+    if isinstance(db.backend, MemoryBackend):
+        # Workers would only write to their own copies of the tables.
+        processes = 1
+    elif processes is None:
+        import multiprocessing
+        processes = multiprocessing.cpu_count()
+
+    started = time.time()
+    size = os.path.getsize(path)
+    # Several ranges per worker, so a slow range doesn't hold up the rest.
+    ranges = _partition(data_start, size, processes * 4 if processes > 1 else 1)
+    table = db[table_name]
+    # Without versioned cache keys, each loaded item has to be invalidated by key.
+    track_keys = table.cache is not None and not table.versioned_cache_keys
+    tasks = [(path, format, start, end, header, data_start, batch_size, max_retries, track_keys)
+             for start, end in ranges]
+
+    stats = LoadStats()
+    keys = set()
+    for result, loaded in _run_tasks(db, table_name, _load_range, tasks, processes, models):
+        stats += result
+        keys.update(loaded)
+    _invalidate_loaded(table, keys)
+    stats.seconds = time.time() - started
+    return stats
+
+
+def main(argv=None):
+    """Run duo's command-line interface: `python -m duo load --help`.
+    """
+    import argparse
+    import importlib
+
+    parser = argparse.ArgumentParser(prog='python -m duo')
+    commands = parser.add_subparsers(dest='command')
+    load_parser = commands.add_parser('load', help='Bulk-load a CSV or NDJSON file into a table.')
+    load_parser.add_argument('table', help='the table to load into')
+    load_parser.add_argument('path', help='a CSV file with a header row, or newline-delimited JSON')
+    load_parser.add_argument('-m', '--models', action='append', default=[],
+                             help='a module to import for its Item sub-classes (repeatable)')
+    load_parser.add_argument('-f', '--format', choices=['csv', 'ndjson'],
+                             help='the input format (default: guessed from the file name)')
+    load_parser.add_argument('-p', '--processes', type=int, help='worker processes (default: one per CPU)')
+    load_parser.add_argument('-b', '--batch-size', type=int, default=25, help='items per batch write')
+    load_parser.add_argument('--max-retries', type=int, default=8, help='retries for unprocessed items')
+    load_parser.add_argument('--backend', choices=['layer2', 'boto3'], default='layer2')
+    load_parser.add_argument('--region', help='the AWS region (boto3 backend only)')
+    load_parser.add_argument('--key', help='AWS access key id (default: from the environment)')
+    load_parser.add_argument('--secret', help='AWS secret access key (default: from the environment)')
+    args = parser.parse_args(argv)
+    if args.command != 'load':
+        parser.print_help()
+        return 2
+
+    for module in args.models:
+        importlib.import_module(module)
+    if args.backend == 'boto3':
+        params = {'region_name': args.region} if args.region else {}
+        backend = Boto3Backend(args.key, args.secret, **params)
+    else:
+        backend = Layer2Backend(args.key, args.secret)
+    db = DynamoDB(backend=backend)
+
+    stats = load(db, args.table, args.path, format=args.format, processes=args.processes,
+                 batch_size=args.batch_size, max_retries=args.max_retries, models=args.models)
+    print('Loaded %s items from %s rows in %.1fs (%.0f items/s); %s batch writes, %s retries.'
+          % (stats.items, stats.rows, stats.seconds, stats.rate, stats.batches, stats.retries))
+    return 0
+
+
+if __name__ == '__main__':
+    # Run against the importable `duo` module, not this `__main__`
+    # copy, so Item sub-classes register where the loader looks and
+    # worker processes can find its functions.
+    import duo
+    sys.exit(duo.main())
@@ -9,10 +9,16 @@ from setuptools import setup
 PYVERSION = float('%s.%s' % (sys.version_info[0], sys.version_info[1]))
 
 INSTALL_REQUIRES = [
-    'boto>=2.5.2',
+    'boto>=2.9.0',
     'six',
 ]
 
+EXTRAS_REQUIRE = {
+    'boto3': ['boto3'],
+    'ujson': ['ujson'],
+    'zstd': ['zstandard'],
+}
+
 TESTS_REQUIRE = [
     'nose',
     'mock',
@@ -25,6 +31,7 @@ SETUP = dict(
     name = "duo",
     py_modules = ['duo', 'test_duo'],
     install_requires = INSTALL_REQUIRES,
+    extras_require = EXTRAS_REQUIRE,
     tests_require = TESTS_REQUIRE,
     test_suite = 'nose.collector',
 
@@ -12,11 +12,81 @@ except ImportError:
     import unittest
 
 import datetime
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import warnings
 
 import boto
 import moto
 
 
+class DictCache(dict):
+    """Just enough of a memcached client, for testing.
+    """
+    def get(self, key):
+        return super(DictCache, self).get(key)
+
+    def set(self, key, value, duration=0):
+        self[key] = value
+
+    def add(self, key, value, duration=0):
+        if key not in self:
+            self[key] = value
+
+    def incr(self, key, delta=1):
+        if key in self:
+            self[key] += delta
+            return self[key]
+
+    def delete(self, key):
+        self.pop(key, None)
+
+
+def _count_and_total(item):
+    return 1, item.count
+
+
+def _add_pairs(a, b):
+    return a[0] + b[0], a[1] + b[1]
+
+
+def _fail_or_sleep(table, task):
+    if task == 0:
+        raise ValueError('Task failed.')
+    time.sleep(1)
+
+
+class StartupTests(unittest.TestCase):
+    def test_import_should_not_load_boto_until_needed(self):
+        script = textwrap.dedent("""
+            import sys
+            import duo
+
+            class StartupItem(duo.Item):
+                table_name = 'startup_table'
+
+                foo = duo.UnicodeField()
+
+            backend = duo.MemoryBackend()
+            backend.create_table('startup_table', 'slug')
+            db = duo.DynamoDB(backend=backend)
+            item = db['startup_table']['fred']
+            item.foo = 'bar'
+            item.put()
+            assert db['startup_table']['fred'].foo == 'bar'
+            assert duo.DynamoDB().backend is not None
+            sys.exit('boto' in sys.modules)
+        """)
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(subprocess.call([sys.executable, '-c', script], env=env), 0)
+
 
 class DynamoDBTests(unittest.TestCase):
     # Default settings for describing the table we want to work with,
@@ -69,7 +139,7 @@ class DuoTests(DynamoDBTests):
         table = self.db[self.table_name]
         item = table[self.hash_key_value, self.range_key_value]
 
-        self.assertIsInstance(item, boto.dynamodb.item.Item)
+        self.assertIsInstance(item, dict)
         self.assertIsInstance(item, self.duo.Item)
         self.assertEqual(item[self.hash_key_name], self.hash_key_value)
 
@@ -283,3 +353,1071 @@ class DuoTests(DynamoDBTests):
         self.assertEqual(Baz, Baz)
         self.assertGreater(Baz, Bar)
         self.assertLess(Baz, 3)
+
+    def test_decoded_field_values_should_be_memoized_until_written(self):
+        class TestItemSubclass(self.duo.Item):
+            table_name = self.table_name
+
+            foo = self.duo.DateTimeField()
+
+        table = self.db[self.table_name]
+        item = table[self.hash_key_value, self.range_key_value]
+
+        item.foo = now = datetime.datetime(2013, 1, 1, 12, 30)
+        self.assertIs(item.foo, item.foo)
+        self.assertEqual(item.foo, now)
+
+        item['foo'] = item['foo'] + 60
+        self.assertEqual(item.foo, now + datetime.timedelta(minutes=1))
+
+        del item.foo
+        self.assertEqual(item.foo, None)
+
+        item.update(foo=100)
+        self.assertEqual(item.foo, datetime.datetime.fromtimestamp(100))
+        self.assertEqual(item.pop('foo'), 100)
+        self.assertEqual((item.foo, item.pop('foo', None)), (None, None))
+        self.assertEqual(item.setdefault('foo', 200), 200)
+        self.assertEqual(item.foo, datetime.datetime.fromtimestamp(200))
+        self.assertEqual(item._updates['foo'], ('PUT', 200))
+        with self.assertRaises(KeyError):
+            item.pop('bar')
+
+    def test_enum_set_fields_should_store_a_bitmask(self):
+        class Placeholder(with_metaclass(self.duo.EnumMeta, object)): pass
+
+        class Foo(Placeholder): pass
+
+        class Bar(Placeholder): pass
+
+        class Baz(Placeholder): pass
+
+        class TestItemSubclass(self.duo.Item):
+            table_name = self.table_name
+
+            places = self.duo.EnumSetField(enum_type=Placeholder)
+
+        table = self.db[self.table_name]
+        item = table[self.hash_key_value, self.range_key_value]
+
+        self.assertEqual(len(item.places), 0)
+        self.assertFalse('places' in item)
+
+        item.places = [Foo, 'Baz']
+        self.assertEqual(item['places'], 0b101)
+        self.assertIn(Foo, item.places)
+        self.assertIn('Baz', item.places)
+        self.assertNotIn(Bar, item.places)
+        self.assertEqual(list(item.places), [Foo, Baz])
+
+        item.places = item.places | [Bar]
+        self.assertEqual(item['places'], 0b111)
+        item.places -= [Foo]
+        self.assertEqual(item.places, self.duo.EnumSet(Placeholder, [Bar, Baz]))
+
+        with self.assertRaises(KeyError):
+            item.places = ['Qux']
+
+    def test_layer2_scans_should_refuse_segments(self):
+        table = self.db[self.table_name]
+        with self.assertRaises(ValueError):
+            list(table.scan(segment=0, total_segments=2))
+
+    def test_enum_set_fields_should_build_scan_filters(self):
+        class Placeholder(with_metaclass(self.duo.EnumMeta, object)): pass
+
+        class Foo(Placeholder): pass
+
+        class Bar(Placeholder): pass
+
+        class Baz(Placeholder): pass
+
+        class TestItemSubclass(self.duo.Item):
+            table_name = self.table_name
+
+            places = self.duo.EnumSetField(enum_type=Placeholder)
+
+        scan_filter = TestItemSubclass.places.scan_filter_all(Foo, Baz)
+        self.assertEqual(sorted(scan_filter['places'].values), [0b101, 0b111])
+
+        scan_filter = TestItemSubclass.places.scan_filter_any(Bar)
+        self.assertEqual(sorted(scan_filter['places'].values), [0b010, 0b011, 0b110, 0b111])
+
+        scan_filter = TestItemSubclass.places.scan_filter_equals([Bar])
+        self.assertEqual(scan_filter['places'].v1, 0b010)
+
+        TestItemSubclass.places.max_filter_values = 2
+        with self.assertRaises(ValueError):
+            TestItemSubclass.places.scan_filter_any(Bar)
+
+    def test_items_should_round_trip_through_the_backend(self):
+        class TestItemSubclass(self.duo.Item):
+            table_name = self.table_name
+
+            test_hash_key = self.duo.UnicodeField()
+            foo = self.duo.UnicodeField()
+            count = self.duo.IntField()
+
+        table = self.db[self.table_name]
+        item = table[self.hash_key_value, self.range_key_value]
+        self.assertTrue(item.is_new)
+        item.foo = 'bar'
+        item.put()
+
+        item = table[self.hash_key_value, self.range_key_value]
+        self.assertFalse(item.is_new)
+        self.assertEqual(item.foo, 'bar')
+
+        item.count = 3
+        item.put()
+        item = table.get_item(self.hash_key_value, self.range_key_value)
+        self.assertEqual(item.count, 3)
+
+        table.create(self.hash_key_value, 'rubble', foo='baz').put()
+        results = list(table.query(self.hash_key_value,
+                                   range_key_condition=self.duo.BEGINS_WITH('r')))
+        self.assertEqual([i.foo for i in results], ['baz'])
+        results = list(table.filter(TestItemSubclass.test_hash_key == self.hash_key_value,
+                                    TestItemSubclass.foo == 'baz').only(TestItemSubclass.count))
+        self.assertEqual([i.dynamo_key for i in results], [(self.hash_key_value, 'rubble')])
+        self.assertNotIn('foo', results[0])
+        self.assertEqual(len(list(table.scan())), 2)
+
+        item.delete()
+        with self.assertRaises(self.duo.ItemNotFound):
+            table.get_item(self.hash_key_value, self.range_key_value)
+
+    def test_json_and_compressed_fields_should_round_trip(self):
+        class TestItemSubclass(self.duo.Item):
+            table_name = self.table_name
+
+            data = self.duo.JSONField(default=lambda item: {})
+            notes = self.duo.CompressedField(threshold=100)
+            blob = self.duo.CompressedJSONField(threshold=100)
+
+        table = self.db[self.table_name]
+        item = table[self.hash_key_value, self.range_key_value]
+        self.assertEqual(item.data, {})
+        item.data = {'a': [1, 2]}
+        self.assertIsInstance(item['data'], text_type)
+        self.assertIs(item.data, item.data)
+
+        item.notes = 'short'
+        self.assertEqual(item['notes'], 'short')
+        item.notes = 'x' * 1000
+        self.assertIsInstance(item['notes'], self.duo.Binary)
+        self.assertLess(len(item['notes']), 100)
+        item.blob = {'rows': list(range(500))}
+        self.assertIsInstance(item['blob'], self.duo.Binary)
+        item.put()
+
+        item = table.get_item(self.hash_key_value, self.range_key_value)
+        self.assertEqual(item.data, {'a': [1, 2]})
+        self.assertEqual(item.notes, 'x' * 1000)
+        self.assertEqual(item.blob, {'rows': list(range(500))})
+
+
+class Boto3BackendTests(unittest.TestCase):
+    table_name = 'test_table'
+
+    def setUp(self):
+        super(Boto3BackendTests, self).setUp()
+        self.dynamo_patcher = moto.mock_dynamodb2()
+        self.dynamo_patcher.start()
+
+        import boto3
+        import duo
+        self.duo = duo
+        client = boto3.client('dynamodb', region_name='us-east-1',
+                              aws_access_key_id='foo', aws_secret_access_key='bar')
+        client.create_table(
+            TableName=self.table_name,
+            KeySchema=[{'AttributeName': 'test_hash_key', 'KeyType': 'HASH'},
+                       {'AttributeName': 'test_range_key', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'test_hash_key', 'AttributeType': 'S'},
+                                  {'AttributeName': 'test_range_key', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 10, 'WriteCapacityUnits': 10},
+        )
+        self.db = duo.DynamoDB(backend=duo.Boto3Backend(client=client))
+
+    def tearDown(self):
+        self.dynamo_patcher.stop()
+
+    def test_table_should_read_key_schema_from_dynamodb(self):
+        table = self.db[self.table_name]
+        self.assertEqual(table.hash_key_name, 'test_hash_key')
+        self.assertEqual(table.range_key_name, 'test_range_key')
+
+    def test_items_should_round_trip_through_the_backend(self):
+        class TestItemSubclass(self.duo.Item):
+            table_name = self.table_name
+
+            foo = self.duo.UnicodeField()
+            on = self.duo.DateField()
+            notes = self.duo.CompressedField()
+
+        table = self.db[self.table_name]
+        item = table['fred', 'flintstone']
+        self.assertTrue(item.is_new)
+        item.foo = 'bar'
+        item.on = today = datetime.date.today()
+        item.put()
+
+        item = table['fred', 'flintstone']
+        self.assertIsInstance(item, TestItemSubclass)
+        self.assertFalse(item.is_new)
+        self.assertEqual(item.foo, 'bar')
+        self.assertEqual(item.on, today)
+
+        for name in ('barney', 'betty', 'wilma'):
+            table.create('fred', name, foo=name).put()
+
+        results = list(table.query('fred', range_key_condition=self.duo.BEGINS_WITH('b'), request_limit=1))
+        self.assertEqual([i.foo for i in results], ['barney', 'betty'])
+        results = list(table.query('fred', max_results=3))
+        self.assertEqual(len(results), 3)
+        results = list(table.scan(scan_filter={'foo': self.duo.EQ('wilma')}))
+        self.assertEqual([i.dynamo_key for i in results], [('fred', 'wilma')])
+
+        item.notes = 'y' * 2000
+        item.put()
+        self.assertEqual(table['fred', 'flintstone'].notes, 'y' * 2000)
+
+        self.assertEqual(item.increment('count', 2), 2)
+        self.assertEqual(table['fred', 'flintstone']['count'], 2)
+        with self.assertRaises(self.duo.ConditionalCheckFailed):
+            item.put(expected_value={'foo': 'baz'})
+
+        item.delete()
+        with self.assertRaises(self.duo.ItemNotFound):
+            table.get_item('fred', 'flintstone')
+
+    def test_documents_should_round_trip_through_the_backend(self):
+        table = self.db[self.table_name]
+        document = {'tags': ['a', 1, None], 'flags': {'on': True, 'off': False}, 'note': None}
+        item = table.create('fred', 'flintstone', **document)
+        item.put()
+
+        item = table.get_item('fred', 'flintstone')
+        self.assertEqual(dict((k, item[k]) for k in document), document)
+        item['count'] = 1
+        item.put()
+        item = table.get_item('fred', 'flintstone')
+        self.assertEqual((dict((k, item[k]) for k in document), item['count']), (document, 1))
+
+    def test_max_results_of_zero_should_return_nothing(self):
+        table = self.db[self.table_name]
+        table.create('fred', 'flintstone').put()
+        self.assertEqual(list(table.query('fred', max_results=0)), [])
+        self.assertEqual(list(table.scan(max_results=0)), [])
+
+    def test_backend_should_batch_reads_and_writes(self):
+        table = self.db[self.table_name]
+        backend = self.db.backend
+        puts = [{'test_hash_key': 'fred', 'test_range_key': str(i), 'n': i} for i in range(30)]
+        self.assertEqual(backend.batch_write(table.table, puts=puts), ([], []))
+
+        found = backend.batch_get(table.table, [('fred', str(i)) for i in range(0, 30, 3)])
+        self.assertEqual(sorted(i['n'] for i in found), list(range(0, 30, 3)))
+
+        backend.batch_write(table.table, deletes=[('fred', str(i)) for i in range(10)])
+        self.assertEqual(len(list(table.query('fred'))), 20)
+
+    def test_pickled_backends_should_rebuild_a_given_client(self):
+        import pickle
+        import boto3
+        from botocore.config import Config
+        client = boto3.client('dynamodb', region_name='eu-west-1', endpoint_url='http://localhost:8000',
+                              aws_access_key_id='foo', aws_secret_access_key='bar',
+                              config=Config(retries={'max_attempts': 2}))
+        backend = pickle.loads(pickle.dumps(self.duo.Boto3Backend(client=client)))
+        rebuilt = backend.connection
+        self.assertIsNot(rebuilt, client)
+        self.assertEqual((rebuilt.meta.region_name, rebuilt.meta.endpoint_url),
+                         ('eu-west-1', 'http://localhost:8000'))
+        self.assertEqual(rebuilt.meta.config.retries, {'max_attempts': 2})
+        self.assertEqual(rebuilt._request_signer._credentials.access_key, 'foo')
+
+
+class MemoryBackendTests(unittest.TestCase):
+    table_name = 'test_table'
+
+    def setUp(self):
+        super(MemoryBackendTests, self).setUp()
+        import duo
+        self.duo = duo
+        self.backend = duo.MemoryBackend()
+        self.backend.create_table(self.table_name, 'test_hash_key', 'test_range_key')
+        self.db = duo.DynamoDB(backend=self.backend)
+
+        class TestItemSubclass(duo.Item):
+            table_name = self.table_name
+
+            test_hash_key = duo.UnicodeField()
+            test_range_key = duo.UnicodeField()
+            foo = duo.UnicodeField()
+            count = duo.IntField()
+            on = duo.DateField()
+
+        self.Item = TestItemSubclass
+        self.table = self.db[self.table_name]
+        for name in ('barney', 'betty', 'dino', 'fred', 'wilma'):
+            self.table.create('flintstone', name, foo=name, count=len(name)).put()
+
+    def test_items_should_round_trip_through_the_backend(self):
+        item = self.table['flintstone', 'fred']
+        self.assertFalse(item.is_new)
+        self.assertEqual(item.foo, 'fred')
+
+        item.count += 1
+        item.add_attribute('visits', 2)
+        item.save()
+        item = self.table.get_item('flintstone', 'fred')
+        self.assertEqual((item.count, item['visits']), (5, 2))
+
+        item.delete()
+        self.assertTrue(self.table['flintstone', 'fred'].is_new)
+
+    def test_query_should_use_range_key_conditions(self):
+        query = lambda *args, **kwargs: [i.foo for i in self.table.query('flintstone', *args, **kwargs)]
+
+        self.assertEqual(query(), ['barney', 'betty', 'dino', 'fred', 'wilma'])
+        self.assertEqual(query(self.duo.BEGINS_WITH('b')), ['barney', 'betty'])
+        self.assertEqual(query(self.duo.GT('dino')), ['fred', 'wilma'])
+        self.assertEqual(query(self.duo.BETWEEN('betty', 'fred')), ['betty', 'dino', 'fred'])
+        self.assertEqual(query(self.duo.LT('dino'), scan_index_forward=False), ['betty', 'barney'])
+        self.assertEqual(query(max_results=2), ['barney', 'betty'])
+        self.assertEqual(query(exclusive_start_key=('flintstone', 'dino')), ['fred', 'wilma'])
+        self.assertEqual(list(self.table.query('rubble')), [])
+
+    def test_max_results_of_zero_should_return_nothing(self):
+        self.assertEqual(list(self.table.query('flintstone', max_results=0)), [])
+        self.assertEqual(list(self.table.scan(max_results=0)), [])
+        self.assertEqual(list(self.table.filter(self.Item.test_hash_key == 'flintstone').limit(0)), [])
+
+    def test_query_should_page_by_request_limit(self):
+        pages = list(self.backend.query(self.table.table, 'flintstone', request_limit=2))
+        self.assertEqual([[i['foo'] for i in p.items] for p in pages],
+                         [['barney', 'betty'], ['dino', 'fred'], ['wilma']])
+        self.assertEqual([p.last_evaluated_key for p in pages],
+                         [('flintstone', 'betty'), ('flintstone', 'fred'), None])
+
+    def test_scan_should_apply_filters(self):
+        results = self.table.scan(scan_filter={'count': self.duo.GE(5)})
+        self.assertEqual(sorted(i.foo for i in results), ['barney', 'betty', 'wilma'])
+
+        results = self.table.scan(attributes_to_get=['foo'], max_results=1)
+        self.assertEqual([dict(i) for i in results][0]['foo'], 'barney')
+
+    def test_scan_should_resume_after_a_deleted_start_key(self):
+        self.table.create('rubble', 'barney', foo='rubble').put()
+        page = next(self.backend.scan(self.table.table, request_limit=3))
+        self.assertEqual(page.last_evaluated_key, ('flintstone', 'dino'))
+        self.table['flintstone', 'dino'].delete()
+        pages = self.backend.scan(self.table.table, exclusive_start_key=page.last_evaluated_key)
+        self.assertEqual([i['foo'] for p in pages for i in p.items], ['fred', 'wilma', 'rubble'])
+
+    def test_conditional_writes_should_check_expected_values(self):
+        item = self.table['flintstone', 'fred']
+        item.foo = 'freddy'
+        with self.assertRaises(self.duo.ConditionalCheckFailed):
+            item.save(expected_value={'foo': 'frederick'})
+        item.save_conditionally()
+        self.assertEqual(self.table.get_item('flintstone', 'fred').foo, 'freddy')
+
+        item = self.table.create('rubble', 'barney', foo='barney')
+        self.assertEqual(item.get_expected(), {'test_hash_key': False, 'test_range_key': False, 'foo': False})
+        item.put_conditionally()
+        item.foo = 'barnard'
+        item.save_conditionally()
+        self.assertEqual(self.table.get_item('rubble', 'barney').foo, 'barnard')
+        with self.assertRaises(self.duo.ConditionalCheckFailed):
+            self.table.create('rubble', 'barney', foo='again').put_conditionally()
+
+    def test_version_field_should_guard_writes_with_one_condition(self):
+        class VersionedItem(self.duo.Item):
+            table_name = 'versioned_table'
+
+            foo = self.duo.UnicodeField()
+            version = self.duo.VersionField()
+
+        self.backend.create_table('versioned_table', 'test_hash_key', 'test_range_key')
+        table = self.db['versioned_table']
+        item = table.create('flintstone', 'fred', foo='fred')
+        item.put()
+        self.assertEqual(item.version, 1)
+        stale = table.get_item('flintstone', 'fred')
+
+        item.foo = 'freddy'
+        item.save()
+        self.assertEqual(item.version, 2)
+        self.assertEqual(item.get_expected(), {'version': 2})
+
+        stale.foo = 'frederick'
+        with self.assertRaises(self.duo.VersionConflict):
+            stale.save()
+        self.assertEqual(stale.version, 1)
+        with self.assertRaises(self.duo.ConditionalCheckFailed):
+            table.create('flintstone', 'fred').put()
+        self.assertEqual(table.get_item('flintstone', 'fred').foo, 'freddy')
+
+        seen = []
+
+        def update(item):
+            seen.append(item.version)
+            if len(seen) == 1:
+                racer = table.get_item('flintstone', 'fred')
+                racer.foo = 'racer'
+                racer.save()
+            item.foo = 'wilma'
+        item = table.retry_on_conflict(('flintstone', 'fred'), update)
+        self.assertEqual(seen, [2, 3])
+        self.assertEqual(item.version, 4)
+        self.assertEqual(table.get_item('flintstone', 'fred').foo, 'wilma')
+        with self.assertRaises(ValueError):
+            table.retry_on_conflict(('flintstone', 'fred'), update, attempts=0)
+
+    def test_sharded_hash_keys_should_scatter_writes_and_gather_queries(self):
+        class ShardedTable(self.duo.Table):
+            table_name = 'sharded_table'
+            write_shards = 4
+            sharded_hash_keys = ['events']
+
+        self.backend.create_table('sharded_table', 'test_hash_key', 'test_range_key')
+        table = self.db['sharded_table']
+        names = ['%02d' % i for i in range(20)]
+        for name in names:
+            table.create('events', name, foo=name).put()
+        table.create('quiet', 'a', foo='a').put()
+
+        self.assertEqual(set(self.backend.tables['sharded_table'].hashes),
+                         set(['events#0', 'events#1', 'events#2', 'events#3', 'quiet']))
+        self.assertEqual(table['events', '07']['foo'], '07')
+        item = table.get_item('events', '07')
+        self.assertEqual(item.dynamo_key, ('events', '07'))
+        self.assertEqual(item._stored_hash_key, 'events#%s' % self.duo._segment_of('07', 4))
+
+        query = lambda *args, **kwargs: [i['foo'] for i in table.query('events', *args, **kwargs)]
+        self.assertEqual(query(), names)
+        self.assertEqual(query(scan_index_forward=False, max_results=3), ['19', '18', '17'])
+        self.assertEqual(query(self.duo.BEGINS_WITH('1'), request_limit=2), names[10:])
+        self.assertEqual(query(exclusive_start_key=('events', '15')), names[16:])
+        self.assertEqual([i['foo'] for i in table['quiet']], ['a'])
+        with self.assertRaises(ValueError):
+            table.query_page('events', 5)
+
+        table.sharded_hash_keys = None
+        table.create('quiet#1', 'b', foo='b').put()
+        item = table['quiet#1', 'b']
+        self.assertEqual((item.hash_key, item['foo']), ('quiet#1', 'b'))
+        self.assertEqual(table[item.dynamo_key]['foo'], 'b')
+        table.sharded_hash_keys = ['events']
+
+        self.backend.thread_safe = False
+        self.assertEqual(query(), names)
+
+        table.random_shards = True
+        table.create('events', '20', foo='20').put()
+        self.assertEqual(table['events', '20']['foo'], '20')
+        self.assertTrue(table['events', '21'].is_new)
+        self.assertEqual(query()[-2:], ['19', '20'])
+
+    def test_filter_should_compile_field_comparisons(self):
+        Item = self.Item
+        for name, day in (('barney', 1), ('fred', 2), ('wilma', 3)):
+            item = self.table['flintstone', name]
+            item.on = datetime.date(2013, 1, day)
+            item.put()
+
+        query = self.table.filter(Item.test_hash_key == 'flintstone', Item.test_range_key > 'betty',
+                                  Item.on >= datetime.date(2013, 1, 2))
+        method, kwargs = query.compile()
+        self.assertEqual(method, 'query')
+        self.assertEqual(kwargs['range_key_condition'], self.duo.GT('betty'))
+        self.assertEqual(kwargs['query_filter'], {'on': self.duo.GE(datetime.date(2013, 1, 2).toordinal())})
+        self.assertEqual([i.foo for i in query], ['fred', 'wilma'])
+        self.assertEqual([i.foo for i in query.reverse().limit(1)], ['wilma'])
+
+        query = self.table.filter(Item.on >= datetime.date(2013, 1, 1), Item.on <= datetime.date(2013, 1, 2))
+        method, kwargs = query.compile()
+        self.assertEqual(method, 'scan')
+        self.assertEqual(sorted(i.foo for i in query), ['barney', 'fred'])
+
+        results = list(self.table.filter(Item.count.is_in([4, 5])).only(Item.foo))
+        self.assertEqual(sorted(i.foo for i in results), ['betty', 'dino', 'fred', 'wilma'])
+        self.assertEqual(set(results[0]), set(['foo', 'test_hash_key', 'test_range_key']))
+
+        with self.assertRaises(ValueError):
+            self.table.filter(Item.count > 1, Item.count < 5).compile()
+
+    def test_filter_should_look_up_hash_only_items(self):
+        class HashItem(self.duo.Item):
+            table_name = 'hash_table'
+
+            slug = self.duo.UnicodeField()
+            foo = self.duo.UnicodeField()
+
+        self.backend.create_table('hash_table', 'slug')
+        table = self.db['hash_table']
+        table.create('fred', foo='bar').put()
+
+        query = table.filter(HashItem.slug == 'fred')
+        self.assertEqual(query.compile()[0], 'get_item')
+        self.assertEqual([i.foo for i in query], ['bar'])
+        self.assertEqual([i.foo for i in query.filter(HashItem.foo == 'baz')], [])
+        self.assertEqual([dict(i) for i in query.filter(HashItem.foo == 'bar').only()],
+                         [{'slug': 'fred', 'foo': 'bar'}])
+        self.assertEqual(list(table.filter(HashItem.slug == 'barney')), [])
+        self.assertEqual(query.page(10).cursor, None)
+
+    def test_fields_should_compare_to_each_other_as_objects(self):
+        Item = self.Item
+        self.assertTrue(Item.foo == Item.foo)
+        self.assertFalse(Item.foo == Item.count)
+        self.assertTrue(Item.foo != Item.count)
+        self.assertNotIn(Item.foo, [Item.count, Item.on])
+        self.assertEqual({Item.foo: 1}[Item.foo], 1)
+
+    def test_field_comparisons_with_none_should_test_for_the_attribute(self):
+        Item = self.Item
+        self.assertEqual((Item.foo == None).condition.operator, 'NULL')
+        self.assertEqual((Item.on != None).condition.operator, 'NOT_NULL')
+        with self.assertRaises(TypeError):
+            Item.count < None
+
+        item = self.table['flintstone', 'fred']
+        item.on = datetime.date(2013, 1, 1)
+        item.save()
+        query = self.table.filter(Item.test_hash_key == 'flintstone')
+        self.assertEqual([i.foo for i in query.filter(Item.on != None)], ['fred'])
+        self.assertEqual(len(list(query.filter(Item.on == None))), 4)
+
+    def test_projected_items_should_hydrate_missing_attributes_in_batches(self):
+        batches = []
+        batch_get = self.backend.batch_get
+
+        def counting_batch_get(table, keys, attributes_to_get=None, consistent_read=False):
+            batches.append((sorted(keys), attributes_to_get))
+            return batch_get(table, keys, attributes_to_get, consistent_read)
+        self.backend.batch_get = counting_batch_get
+
+        items = list(self.table.filter(self.Item.test_hash_key == 'flintstone').only(self.Item.foo))
+        self.assertTrue(all(i.is_partial for i in items))
+        self.assertFalse('count' in items[0])
+        self.assertEqual([i.count for i in items], [6, 5, 4, 4, 5])
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(len(batches[0][0]), 5)
+        self.assertEqual(batches[0][1][0], 'count')
+        self.assertEqual(items[0].on, None)
+        self.assertEqual(len(batches), 2)
+
+        items[0].foo = 'barney!'
+        items[0].put()
+        self.assertFalse(items[0].is_partial)
+        item = self.table.get_item('flintstone', 'barney')
+        self.assertEqual((item.foo, item.count), ('barney!', 6))
+
+    def test_streamed_projected_items_should_still_hydrate_in_batches(self):
+        batches = []
+        batch_get = self.backend.batch_get
+
+        def counting_batch_get(table, keys, attributes_to_get=None, consistent_read=False):
+            batches.append(sorted(keys))
+            return batch_get(table, keys, attributes_to_get, consistent_read)
+        self.backend.batch_get = counting_batch_get
+
+        keys = ['test_hash_key', 'test_range_key', 'foo']
+        counts = [i.count for i in self.table.query('flintstone', attributes_to_get=keys, request_limit=3)]
+        self.assertEqual(counts, [6, 5, 4, 4, 5])
+        self.assertEqual([len(keys) for keys in batches], [3, 2])
+
+    def test_load_should_build_items_through_fields_and_batch_writes(self):
+        self.backend.create_table('load_table', 'test_hash_key', 'test_range_key')
+        writes = []
+        batch_write = self.backend.batch_write
+
+        def flaky_batch_write(table, puts=(), deletes=()):
+            writes.append(len(puts))
+            unprocessed, _ = batch_write(table, puts[1:] if len(writes) == 1 else puts, deletes)
+            return (puts[:1] if len(writes) == 1 else unprocessed), []
+        self.backend.batch_write = flaky_batch_write
+
+        class LoadItem(self.duo.Item):
+            table_name = 'load_table'
+
+            count = self.duo.IntField()
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'rows.csv')
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write('test_hash_key,test_range_key,count,note\n')
+            for i in range(30):
+                f.write('rubble,r%02d,%s,%s\n' % (i, i, 'x' if i % 2 else ''))
+            f.write('rubble,r00,100,"again, and again"\n')
+
+        stats = self.duo.load(self.db, 'load_table', path, processes=1, batch_size=10)
+        self.assertEqual((stats.rows, stats.items, stats.batches, stats.retries), (31, 31, 5, 1))
+        self.assertEqual(writes, [10, 1, 10, 10, 1])
+        items = list(self.db['load_table'].query('rubble'))
+        self.assertEqual(len(items), 30)
+        self.assertEqual(items[1].count, 1)
+        self.assertEqual((items[1]['note'], 'note' in items[2]), ('x', False))
+        self.assertEqual((items[0].count, items[0]['note']), (100, 'again, and again'))
+
+    def test_load_partitions_should_cover_every_line_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'rows.ndjson')
+        with io.open(path, 'w', encoding='utf-8') as f:
+            for i in range(100):
+                f.write('{"test_hash_key": "h", "test_range_key": "%s", "pad": "%s"}\n' % (i, 'x' * (i % 7)))
+
+        size = os.path.getsize(path)
+        for count in (1, 3, 16, size):
+            rows = [row for start, end in self.duo._partition(0, size, count)
+                    for row in self.duo._rows(path, 'ndjson', start, end)]
+            self.assertEqual([r['test_range_key'] for r in rows], [str(i) for i in range(100)])
+
+    def test_csv_rows_should_be_parsed_as_they_are_read(self):
+        def lines():
+            yield b'a,b\n'
+            raise AssertionError('Read too far.')
+        self.assertEqual(next(self.duo._parse_csv(lines())), ['a', 'b'])
+
+    def test_map_reduce_should_combine_segments_of_a_parallel_scan(self):
+        for name in ('bamm-bamm', 'pebbles'):
+            self.table.create('rubble', name, foo=name, count=len(name)).put()
+        segments = [sorted(i.foo for i in self.table.scan(segment=s, total_segments=3)) for s in range(3)]
+        self.assertEqual(sorted(sum(segments, [])), sorted(i.foo for i in self.table.scan()))
+
+        result = self.table.map_reduce(_count_and_total, _add_pairs, segments=3, processes=1)
+        self.assertEqual(result, (7, 6 + 5 + 4 + 4 + 5 + 9 + 7))
+        result = self.table.map_reduce(_count_and_total, _add_pairs, processes=1,
+                                       scan_filter={'count': self.duo.GT(5)})
+        self.assertEqual(result, (3, 6 + 9 + 7))
+        self.assertEqual(self.table.map_reduce(_count_and_total, _add_pairs, processes=1,
+                                               scan_filter={'count': self.duo.GT(10)}), None)
+
+    def test_failed_tasks_should_stop_the_worker_pool(self):
+        started = time.time()
+        with self.assertRaises(ValueError):
+            list(self.duo._run_tasks(self.db, self.table_name, _fail_or_sleep, range(9), 2))
+        self.assertLess(time.time() - started, 2)
+
+    def test_map_reduce_should_run_across_worker_processes(self):
+        import pickle
+        copy = pickle.loads(pickle.dumps(self.backend))
+        pages = copy.scan(copy.get_table(self.table_name))
+        self.assertEqual(sum(len(page.items) for page in pages), 5)
+
+        result = self.table.map_reduce(_count_and_total, _add_pairs, segments=4, processes=2)
+        self.assertEqual(result, (5, 6 + 5 + 4 + 4 + 5))
+
+    def test_increment_should_add_without_reading(self):
+        self.backend.get_item = None
+        item = self.table.create('flintstone', 'fred')
+        item.foo = 'unsaved'
+        self.assertEqual(item.increment('count', 3), 7)
+        self.assertEqual(item.increment('count', -1), 6)
+        self.assertEqual(item.count, 6)
+        self.assertFalse(item.is_new)
+        self.assertEqual(item.increment('visits'), 1)
+        stored, = self.table.query('flintstone', self.duo.EQ('fred'))
+        self.assertEqual((stored.foo, stored.count, stored['visits']), ('fred', 6, 1))
+        with self.assertRaises(AttributeError):
+            item.increment('test_range_key')
+
+    def test_counter_aggregator_should_sum_increments_between_flushes(self):
+        updates = []
+        update_item = self.backend.update_item
+
+        def counting_update_item(*args, **kwargs):
+            updates.append(args[1:4])
+            return update_item(*args, **kwargs)
+        self.backend.update_item = counting_update_item
+
+        with self.duo.CounterAggregator(self.table, flush_interval=3600) as counters:
+            for i in range(10):
+                counters.increment(('flintstone', 'fred'), 'count')
+                counters.increment(('flintstone', 'fred'), 'visits', 2)
+            self.assertEqual(updates, [])
+            self.assertEqual(counters.read(('flintstone', 'fred'), 'count'), 14)
+        self.assertEqual(updates, [('flintstone', 'fred', {'count': ('ADD', 10), 'visits': ('ADD', 20)})])
+        item = self.table['flintstone', 'fred']
+        self.assertEqual((item.count, item['visits']), (14, 20))
+
+        counters = self.duo.CounterAggregator(self.table, flush_interval=0, shards=4)
+        for i in range(20):
+            counters.increment(('hot', 'x'), 'count')
+        self.assertEqual(len(updates), 21)
+        self.assertTrue(all(u[0].startswith('hot#') for u in updates[1:]))
+        self.assertEqual(counters.read(('hot', 'x'), 'count'), 20)
+        with self.assertRaises(ValueError):
+            counters.increment((1, 'x'), 'count')
+
+        class NumberedItem(self.duo.Item):
+            table_name = 'numbered_table'
+
+            number = self.duo.IntField()
+
+        self.backend.create_table('numbered_table', 'number', 'test_range_key')
+        with self.assertRaises(ValueError):
+            self.duo.CounterAggregator(self.db['numbered_table'], shards=4)
+        self.duo.CounterAggregator(self.db['numbered_table'])
+
+    def test_cursors_should_resume_where_the_last_page_ended(self):
+        self.table.cursor_secret = 'sekrit'
+        page = self.table.query_page('flintstone', 2, query_filter={'count': self.duo.GE(5)})
+        self.assertEqual([i.foo for i in page.items], ['barney', 'betty'])
+        self.assertNotIn('=', page.cursor)
+
+        queries = []
+        query = self.backend.query
+
+        def counting_query(*args, **kwargs):
+            queries.append(kwargs)
+            return query(*args, **kwargs)
+        self.backend.query = counting_query
+        page = self.table.page(page.cursor)
+        self.assertEqual([i.foo for i in page.items], ['wilma'])
+        self.assertEqual((queries[0]['exclusive_start_key'], queries[0]['max_results']),
+                         (['flintstone', 'betty'], 2))
+        self.assertIsNone(page.cursor)
+
+        page = self.table.filter(self.Item.count < 5).only(self.Item.foo).page(1)
+        self.assertEqual([i.foo for i in page.items], ['dino'])
+        page = self.table.page(page.cursor)
+        self.assertEqual([i.foo for i in page.items], ['fred'])
+        self.assertTrue(page.items[0].is_partial)
+
+        payload, signature = page.cursor.split('.')
+        with self.assertRaises(self.duo.InvalidCursor):
+            self.table.page(payload[:-2] + 'xx.' + signature)
+        with self.assertRaises(self.duo.InvalidCursor):
+            self.table.page('garbage')
+        self.table.cursor_secret = 'other'
+        with self.assertRaises(self.duo.InvalidCursor):
+            self.table.page(page.cursor)
+
+    def test_cursor_pages_should_stop_after_a_few_requests(self):
+        self.table.cursor_secret = 'sekrit'
+        self.table.cursor_max_requests = 2
+        query = self.backend.query
+        self.backend.query = lambda *args, **kwargs: query(*args, **dict(kwargs, request_limit=1))
+
+        page = self.table.query_page('flintstone', 2, query_filter={'count': self.duo.LT(5)})
+        self.assertEqual((page.items, page.cursor is None), ([], False))
+        page = self.table.page(page.cursor)
+        self.assertEqual(([i.foo for i in page.items], page.cursor is None), (['dino', 'fred'], False))
+        page = self.table.page(page.cursor)
+        self.assertEqual((page.items, page.cursor), ([], None))
+
+
+class MirrorTests(unittest.TestCase):
+    table_name = 'mirrored_table'
+
+    def setUp(self):
+        super(MirrorTests, self).setUp()
+        import duo
+        self.duo = duo
+        self.backend = duo.MemoryBackend()
+        self.backend.create_table(self.table_name, 'test_hash_key', 'test_range_key')
+        self.db = duo.DynamoDB(backend=self.backend)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.mirror = duo.Mirror(os.path.join(directory, 'mirror.db'), updated_field='updated',
+                                 max_staleness=3600)
+
+        class MirroredTable(duo.Table):
+            table_name = self.table_name
+            mirror = self.mirror
+
+        class MirroredItem(duo.Item):
+            table_name = self.table_name
+
+            foo = duo.UnicodeField()
+            updated = duo.DateTimeField()
+
+        self.table = self.db[self.table_name]
+        self.long_ago = datetime.datetime(2013, 1, 1)
+        for name in ('barney', 'betty', 'fred'):
+            item = self.table.create('flintstone', name, foo=name)
+            item.updated = self.long_ago
+            item.put()
+
+    def test_lookups_should_be_served_from_the_mirror(self):
+        self.assertEqual(self.table['flintstone', 'fred'].foo, 'fred')
+
+        def no_reads(*args, **kwargs):
+            raise AssertionError('The backend was read.')
+        self.backend.get_item = self.backend.query = self.backend.scan = no_reads
+
+        item = self.table['flintstone', 'fred']
+        self.assertFalse(item.is_new)
+        self.assertEqual(item.updated, self.long_ago)
+        self.assertEqual([i.foo for i in self.table['flintstone']], ['barney', 'betty', 'fred'])
+        self.assertTrue(self.table['flintstone', 'wilma'].is_new)
+
+        item.foo = 'freddy'
+        item.put()
+        self.assertEqual(self.table['flintstone', 'fred'].foo, 'freddy')
+        item.foo = 'frederick'
+        item['pets'] = set(['dino'])
+        item.save()
+        item.increment('visits')
+        item = self.table['flintstone', 'fred']
+        self.assertEqual((item.foo, item['pets'], item['visits']), ('frederick', set(['dino']), 1))
+        item.delete()
+        self.assertTrue(self.table['flintstone', 'fred'].is_new)
+
+    def test_lookups_should_skip_a_mirror_still_being_filled(self):
+        import sqlite3
+        self.mirror.connection
+        other = sqlite3.connect(self.mirror.path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute('BEGIN IMMEDIATE')
+        # Written behind the mirror's back, so only the first scan would find it.
+        self.backend.put_item(self.table.table, {'test_hash_key': 'flintstone', 'test_range_key': 'wilma',
+                                                 'foo': 'wilma'})
+
+        item = self.table['flintstone', 'wilma']
+        self.assertEqual((item.is_new, item.foo), (False, 'wilma'))
+        self.assertEqual([i.foo for i in self.table['flintstone']], ['barney', 'betty', 'fred', 'wilma'])
+        other.execute('COMMIT')
+
+        def no_reads(*args, **kwargs):
+            raise AssertionError('The backend was read.')
+        self.backend.get_item = self.backend.query = no_reads
+        self.assertEqual(self.table['flintstone', 'wilma'].foo, 'wilma')
+
+    def test_sharded_hash_keys_should_be_queried_across_the_mirror(self):
+        self.table.write_shards = 3
+        for name in ('bamm-bamm', 'barney', 'betty'):
+            self.table.create('rubble', name, foo=name).put()
+        self.assertEqual([i.foo for i in self.table['rubble']], ['bamm-bamm', 'barney', 'betty'])
+        self.assertEqual(self.table['rubble', 'betty'].hash_key, 'rubble')
+
+    def test_mirror_should_store_json(self):
+        import sqlite3
+        connection = sqlite3.connect(self.mirror.path)
+        attrs, = connection.execute("SELECT attrs FROM items WHERE range_key = 'fred'").fetchone()
+        self.assertEqual(json.loads(attrs)['foo'], 'fred')
+
+    def test_stale_readers_should_not_wait_for_another_refresh(self):
+        self.assertEqual(self.table['flintstone', 'fred'].foo, 'fred')
+        import sqlite3
+        other = sqlite3.connect(self.mirror.path, isolation_level=None)
+        other.execute("UPDATE meta SET value = 0 WHERE name = 'refreshed_at'")
+        self.mirror._local.fresh_until = 0
+        other.execute('BEGIN IMMEDIATE')
+        try:
+            started = time.time()
+            self.assertEqual(self.table['flintstone', 'fred'].foo, 'fred')
+            self.assertLess(time.time() - started, 5)
+        finally:
+            other.execute('ROLLBACK')
+
+    def test_refresh_should_fetch_items_updated_since_the_checkpoint(self):
+        item = self.table.create('flintstone', 'wilma', foo='wilma')
+        item.updated = self.long_ago + datetime.timedelta(days=1)
+        item.put()
+        self.assertEqual(self.mirror.refresh(self.table, force=True), 4)
+        for name, updated in (('barney', datetime.datetime.now()), ('betty', self.long_ago)):
+            attrs = self.backend.get_item(self.table.table, 'flintstone', name)
+            attrs.update(foo=name.upper(), updated=self.table.item_class.updated.from_python(None, updated))
+            self.backend.put_item(self.table.table, attrs)
+        self.backend.delete_item(self.table.table, 'flintstone', 'fred')
+
+        self.assertEqual(self.table['flintstone', 'barney'].foo, 'barney')
+        # Barney, and Wilma again, within the overlap of the checkpoint.
+        self.assertEqual(self.mirror.refresh(self.table, force=True), 2)
+        self.assertEqual([i.foo for i in self.table['flintstone']], ['BARNEY', 'betty', 'fred', 'wilma'])
+        self.assertEqual(self.mirror.refresh(self.table, full=True, force=True), 3)
+        self.assertEqual([i.foo for i in self.table['flintstone']], ['BARNEY', 'BETTY', 'wilma'])
+
+
+class CacheTests(unittest.TestCase):
+    table_name = 'cached_table'
+
+    def setUp(self):
+        super(CacheTests, self).setUp()
+        import duo
+        self.duo = duo
+        self.cache = DictCache()
+        self.backend = duo.MemoryBackend()
+        self.backend.create_table(self.table_name, 'test_hash_key', 'test_range_key')
+        self.db = duo.DynamoDB(backend=self.backend, cache=self.cache)
+
+        class CachedTable(duo.Table):
+            table_name = self.table_name
+            query_cache_duration = 60
+
+        class CachedItem(duo.Item):
+            table_name = self.table_name
+            cache_duration = 60
+
+            foo = duo.UnicodeField()
+
+        self.table = self.db[self.table_name]
+        for name in ('barney', 'betty', 'fred'):
+            self.table.create('flintstone', name, foo=name).put()
+
+    def count_queries(self):
+        queries = []
+        query = self.backend.query
+
+        def counting_query(*args, **kwargs):
+            queries.append(args)
+            return query(*args, **kwargs)
+        self.backend.query = counting_query
+        return queries
+
+    def test_query_results_should_be_cached_until_the_hash_key_is_written(self):
+        queries = self.count_queries()
+        query = lambda: [i.foo for i in self.table.query('flintstone', max_results=2)]
+
+        self.assertEqual(query(), ['barney', 'betty'])
+        self.assertEqual(query(), ['barney', 'betty'])
+        self.assertEqual(len(queries), 1)
+
+        self.table.create('rubble', 'barney', foo='barney').put()
+        self.assertEqual(query(), ['barney', 'betty'])
+        self.assertEqual(len(queries), 1)
+
+        self.table.create('flintstone', 'baby puss', foo='baby puss').put()
+        self.assertEqual(query(), ['baby puss', 'barney'])
+        self.assertEqual(len(queries), 2)
+
+        self.table['flintstone', 'baby puss'].delete()
+        self.assertEqual(query(), ['barney', 'betty'])
+        self.assertEqual(len(queries), 3)
+
+    def test_query_cache_should_key_on_query_parameters(self):
+        queries = self.count_queries()
+        list(self.table.query('flintstone', range_key_condition=self.duo.BEGINS_WITH('b')))
+        list(self.table.query('flintstone', range_key_condition=self.duo.BEGINS_WITH('f')))
+        list(self.table.query('flintstone', range_key_condition=self.duo.BEGINS_WITH('b')))
+        list(self.table.query('flintstone', consistent_read=True))
+        self.assertEqual(len(queries), 3)
+
+    def test_query_cache_should_cache_and_resume_page_by_page(self):
+        queries = self.count_queries()
+        query = lambda: [i.foo for i in self.table.query('flintstone', request_limit=1)]
+        self.assertEqual(query(), ['barney', 'betty', 'fred'])
+        self.assertEqual(query(), ['barney', 'betty', 'fred'])
+        self.assertEqual(len(queries), 1)
+
+        params = dict(range_key_condition=None, attributes_to_get=None, request_limit=1, max_results=None,
+                      scan_index_forward=True, exclusive_start_key=None, query_filter=None)
+        generation = self.table._get_generation('flintstone')
+        self.assertEqual(len([k for k in self.cache if ':query_' in k]), 4)
+        del self.cache[self.table._get_query_cache_key('flintstone', generation, params, 1)]
+        self.assertEqual(query(), ['barney', 'betty', 'fred'])
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(query(), ['barney', 'betty', 'fred'])
+        self.assertEqual(len(queries), 2)
+
+    def test_query_cache_outages_should_fall_back_to_dynamodb(self):
+        def broken(*args, **kwargs):
+            raise IOError('The cache is down.')
+        self.cache.get = self.cache.set = self.cache.add = broken
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            self.assertEqual([i.foo for i in self.table.query('flintstone')], ['barney', 'betty', 'fred'])
+
+    def test_query_cache_keys_should_not_collide_with_item_keys(self):
+        self.assertNotEqual(self.table._get_generation_key('flintstone'),
+                            self.table._get_cache_key('flintstone', 'generation'))
+
+    def test_lost_generations_should_not_revive_old_results(self):
+        list(self.table.query('flintstone'))
+        del self.cache[self.table._get_generation_key('flintstone')]
+        self.table.create('flintstone', 'wilma', foo='wilma').put()
+        self.assertEqual([i.foo for i in self.table.query('flintstone')][-1], 'wilma')
+
+    def test_cache_results_should_cache_whole_pages_at_once(self):
+        self.table.cache_results = True
+        for key in list(self.cache):
+            del self.cache[key]
+        batches = []
+        self.cache.set_multi = lambda mapping, duration=0: (batches.append(sorted(mapping)),
+                                                              self.cache.update(mapping))
+
+        list(self.table.query('flintstone', attributes_to_get=['foo']))
+        self.assertEqual(batches, [])
+        list(self.table.query('flintstone', request_limit=2))
+        self.assertEqual([len(b) for b in batches], [2, 1])
+
+        def no_reads(*args, **kwargs):
+            raise AssertionError('The backend was read.')
+        self.backend.get_item = no_reads
+        self.assertEqual(self.table['flintstone', 'fred'].foo, 'fred')
+
+        del self.cache[self.table._get_cache_key('flintstone', 'betty')]
+        list(self.table.scan(scan_filter={'foo': self.duo.EQ('betty')}))
+        self.assertEqual(self.table['flintstone', 'betty'].foo, 'betty')
+
+    def test_cache_keys_should_be_bounded_and_memcached_safe(self):
+        self.assertEqual(self.table._get_cache_key('flintstone', 'fred'), 'cached_table_flintstone_fred')
+        for hash_key in ('x' * 300, u'caf\xe9', 'fred flintstone'):
+            key = self.table._get_cache_key(hash_key, None)
+            self.assertTrue(key.startswith('sha1_'))
+            self.assertEqual(len(key), 45)
+        self.assertNotEqual(self.table._get_cache_key('x' * 300, None), self.table._get_cache_key('x' * 301, None))
+
+        item = self.table.create(u'caf\xe9', 'x' * 300, foo='long')
+        item.put()
+        self.assertIn(item._cache_key, self.cache)
+        self.assertEqual(self.table[u'caf\xe9', 'x' * 300].foo, 'long')
+
+    def test_invalidate_cache_should_drop_the_whole_table_at_once(self):
+        self.assertRaises(ValueError, self.table.invalidate_cache)
+        self.table.versioned_cache_keys = True
+        queries = self.count_queries()
+        list(self.table.query('flintstone'))
+        list(self.table.query('flintstone'))
+        self.assertEqual(len(queries), 1)
+        self.table['flintstone', 'fred'].put()
+
+        def counting_get_item(*args, **kwargs):
+            reads.append(args)
+            return get_item(*args, **kwargs)
+        reads, get_item = [], self.backend.get_item
+        self.backend.get_item = counting_get_item
+        self.assertEqual(self.table['flintstone', 'fred'].foo, 'fred')
+        self.assertEqual(len(reads), 0)
+
+        self.table.invalidate_cache()
+        self.assertEqual(self.table['flintstone', 'fred'].foo, 'fred')
+        self.assertEqual(len(reads), 1)
+        list(self.table.query('flintstone'))
+        self.assertEqual(len(queries), 2)
+
+    def test_lost_namespace_versions_should_start_a_new_namespace(self):
+        self.table.versioned_cache_keys = True
+        self.cache.add = lambda key, value, duration=0: None
+        namespaces = [self.table._cache_namespace() for i in range(2)]
+        self.assertNotIn('None', namespaces[0])
+        self.assertNotEqual(namespaces[0], namespaces[1])
+
+        del self.cache.add
+        namespace = self.table._cache_namespace()
+        self.assertEqual(self.table._cache_namespace(), namespace)
+        self.table.invalidate_cache()
+        self.assertNotEqual(self.table._cache_namespace(), namespace)
+
+    def test_load_should_invalidate_cached_items_and_queries(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'rows.csv')
+
+        for versioned, name in ((False, 'Fred'), (True, 'FRED')):
+            type(self.table).versioned_cache_keys = versioned
+            self.table['flintstone', 'fred'].put()
+            list(self.table.query('flintstone'))
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write('test_hash_key,test_range_key,foo\nflintstone,fred,%s\n' % name)
+            self.duo.load(self.db, self.table_name, path, processes=1)
+            self.assertEqual(self.table['flintstone', 'fred'].foo, name)
+            self.assertEqual([i.foo for i in self.table.query('flintstone')], ['barney', 'betty', name])